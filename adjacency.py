@@ -0,0 +1,123 @@
+import numpy as np
+
+# Neighbour relations of the icosphere mesh in compressed sparse row (CSR) form.
+#
+# A relation over n items is an indptr array of n + 1 offsets and an indices array: the neighbours of item i are
+# indices[indptr[i]:indptr[i + 1]], so a lookup is a slice of length degree(i). Three relations are kept:
+#
+#   - vertex to vertex: the vertices sharing an edge with each vertex;
+#   - vertex to face: the faces using each vertex;
+#   - face to face: the faces sharing an edge with each face.
+#
+# Rows around a vertex are sorted counter-clockwise as seen from outside the sphere, so walking a row walks
+# around the vertex, and position k of a vertex's face row is the face between positions k and k + 1 of its vertex
+# row. Row f of face to face has the neighbour across edge face_edges[f, k] in position k.
+
+# Relation names, each stored as '<name>_indptr' and '<name>_indices'
+RELATIONS = ('vertex_vertices', 'vertex_faces', 'face_faces')
+
+# Most neighbours, and faces, of any vertex: the 12 icosahedron vertices have 5, every other vertex 6
+MAX_DEGREE = 6
+
+
+class Adjacency:
+    """One neighbour relation in compressed sparse row form."""
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def neighbors(self, item):
+        """
+        Get the neighbours of one item.
+
+        Args:
+            item (int): Row to look up.
+
+        Returns:
+            numpy.ndarray: The neighbours, as a view into indices.
+        """
+        return self.indices[self.indptr[item]:self.indptr[item + 1]]
+
+    def degree(self, item=None):
+        """
+        Get the number of neighbours of one item, or of every item.
+
+        Args:
+            item (int): Row to look up. Leave out to get the degree of every row.
+
+        Returns:
+            int or numpy.ndarray: The degree.
+        """
+        if item is None:
+            return np.diff(self.indptr.astype(np.int64))
+        return int(self.indptr[item + 1]) - int(self.indptr[item])
+
+
+def array_names():
+    """
+    Get the names of the arrays built by build_arrays.
+
+    Returns:
+        list: The indptr and indices array name of every relation.
+    """
+    return [name + suffix for name in RELATIONS for suffix in ('_indptr', '_indices')]
+
+
+def build_arrays(vertex_count, faces, face_edges):
+    """
+    Build the vertex to vertex, vertex to face and face to face relations of a mesh.
+
+    Nothing here sorts or looks at positions. Every edge of the closed mesh is shared by exactly two faces, which
+    gives the face to face relation from per-edge sums, and faces are wound counter-clockwise as seen from outside
+    the sphere, so the rows around every vertex are walked in order from face to face across their edges.
+
+    Args:
+        vertex_count (int): Number of vertices.
+        faces (numpy.ndarray): (F, 3) array of vertex indices of a closed mesh, wound counter-clockwise.
+        face_edges (numpy.ndarray): (F, 3) map from each face's ab, bc and ca edge to its row in the edge table, as
+            from geometry.edge_table.
+
+    Returns:
+        dict: '<relation>_indptr' and '<relation>_indices' arrays for every name in RELATIONS, as int64.
+    """
+    face_count = len(faces)
+    faces = faces.astype(np.int64, copy=False)
+    face_ids = np.arange(face_count)
+    arrays = {}
+
+    # Face to face: the neighbour across an edge is the sum of the edge's two faces minus the face itself
+    edge_face_sums = np.bincount(face_edges.ravel(), weights=np.repeat(face_ids, 3).astype(np.float64))
+    face_faces = (edge_face_sums.astype(np.int64)[face_edges] - face_ids[:, np.newaxis]).ravel()
+    del edge_face_sums
+    arrays['face_faces_indptr'] = np.arange(0, 3 * face_count + 1, 3, dtype=np.int64)
+    arrays['face_faces_indices'] = face_faces
+
+    # Walk around every vertex at once, through its corners as positions in the flattened faces (3 * face + corner),
+    # starting from whichever corner lands last. The face after corner k's face, counter-clockwise, is the one across
+    # the edge from corner k + 2 back to corner k, which is edge k + 2 of the face.
+    corners = faces.ravel()
+    vertex_ids = np.arange(vertex_count)
+    current = np.empty(vertex_count, dtype=np.int64)
+    current[corners] = np.arange(3 * face_count)
+    walk = [current]
+    for _ in range(1, MAX_DEGREE):
+        first = 3 * face_faces[current - current % 3 + (current + 2) % 3]
+        current = first + (corners[first + 1] == vertex_ids) + 2 * (corners[first + 2] == vertex_ids)
+        walk.append(current)
+    del first
+
+    # Rows of 5 or 6 corners, the 6th of a 5-neighbour vertex being back where it started. Each corner's face is on
+    # the vertex to face row, and the corner after it on the vertex to vertex row.
+    degrees = np.bincount(corners, minlength=vertex_count)
+    indptr = np.zeros(vertex_count + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    walk = np.stack(walk, axis=1)[np.arange(MAX_DEGREE) < degrees[:, np.newaxis]]
+    arrays['vertex_vertices_indptr'] = indptr
+    arrays['vertex_vertices_indices'] = corners[walk - walk % 3 + (walk + 1) % 3]
+    arrays['vertex_faces_indptr'] = indptr.copy()
+    arrays['vertex_faces_indices'] = walk // 3
+    return arrays
@@ -0,0 +1,106 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import geometry
+import terrain
+import savegame
+from config import COMPACT_MESH, SAVE_DIR
+
+# Pre-generate pools of seeded globes, e.g. on a build server, as saves the game can load.
+#
+# Only the NumPy geometry core, the terrain generator and the save writer are used, so pygame is never imported.
+# Every preset's mesh is built (or found in the mesh cache) once, up front, and the globes are then generated by a
+# process pool, one task per (preset, seed). Workers memory map the cached mesh, so its pages are shared between them.
+
+
+def globe_path(output, iteration_name, seed):
+    return os.path.join(output, '{}-s{}{}'.format(iteration_name.lower(), seed, savegame.SAVE_EXTENSION))
+
+
+def generate_globe(iteration_name, seed, compact, output, requested_mapsize=None):
+    """
+    Generate the terrain of one globe and write it as a save.
+
+    Args:
+        iteration_name (str): Key into geometry.ITERATIONS. Its mesh should already be in the mesh cache.
+        seed (int): Terrain seed.
+        compact (bool): Whether the mesh uses compact storage.
+        output (str): Directory to write the save to.
+        requested_mapsize (str): The preset that was asked for, if the memory budget downgraded it.
+
+    Returns:
+        tuple: (path, land fraction, seconds taken).
+    """
+    start = time.perf_counter()
+    mesh = geometry.load_or_build_mesh(iteration_name, compact)
+    generated = terrain.generate(mesh['vertices'], seed)
+    path = globe_path(output, iteration_name, seed)
+    savegame.write(path, iteration_name, compact, seed, len(mesh['vertices']), generated.arrays,
+                   requested_mapsize=requested_mapsize)
+    return path, generated.land_fraction, time.perf_counter() - start
+
+
+def generate_pool(presets, seeds, output, compact=False, workers=None):
+    """
+    Generate a globe for every preset and seed.
+
+    Args:
+        presets (list): Keys into geometry.ITERATIONS. Presets over the mesh memory budget are downgraded or
+            skipped, following MESH_BUDGET_POLICY.
+        seeds (list): Terrain seeds.
+        output (str): Directory to write the saves to.
+        compact (bool): Use compact mesh storage.
+        workers (int): Number of worker processes. Defaults to the number of CPU cores.
+
+    Returns:
+        list: The paths written.
+    """
+    tasks = []
+    for requested in presets:
+        try:
+            iteration_name = geometry.fit_memory_budget(requested, compact)
+        except geometry.MeshBudgetExceeded as e:
+            print('Skipping {}: {}'.format(requested, e))
+            continue
+
+        start = time.perf_counter()
+        stats = geometry.mesh_stats(geometry.load_or_build_mesh(iteration_name, compact))
+        print('{} mesh: {} vertices, {} faces, {:.1f} MB ({:.1f} s)'.format(
+            iteration_name, stats['vertices'], stats['faces'], stats['nbytes'] / 1024 / 1024,
+            time.perf_counter() - start))
+        tasks.extend((iteration_name, seed, requested) for seed in seeds)
+
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(generate_globe, iteration_name, seed, compact, output, requested)
+                   for iteration_name, seed, requested in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, land_fraction, seconds = future.result()
+            print('[{}/{}] {} (land {:.0%}, {:.1f} s)'.format(done, len(futures), path, land_fraction, seconds))
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-generate seeded globes as saves, without pygame.')
+    parser.add_argument('--presets', nargs='+', default=['Normal'], choices=list(geometry.ITERATIONS),
+                        help='Presets to generate (default: Normal).')
+    parser.add_argument('--count', type=int, default=8, help='Globes per preset (default: 8).')
+    parser.add_argument('--first-seed', type=int, default=1, help='Seed of the first globe; the rest count up from '
+                                                                  'it (default: 1).')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU core).')
+    parser.add_argument('--compact', action='store_true', default=COMPACT_MESH,
+                        help='Use compact float32 and narrow index storage.')
+    parser.add_argument('--output', default=SAVE_DIR, help='Directory to write the saves to (default: {}).'.format(
+        SAVE_DIR))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seeds = range(args.first_seed, args.first_seed + args.count)
+    paths = generate_pool(args.presets, seeds, args.output, args.compact, args.workers)
+    print('Wrote {} globes to {} in {:.1f} s'.format(len(paths), args.output, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+# Run headless: pygame only ever draws to an offscreen Surface here
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+from config import SCREEN_WIDTH, SCREEN_HEIGHT  # noqa: E402
+from icosphere import Icosphere, MIN_SCALE  # noqa: E402
+import geometry  # noqa: E402
+import terrain  # noqa: E402
+
+
+def time_call(func, repeat, setup=None):
+    """
+    Time a function over several runs.
+
+    Args:
+        func (callable): The function to time.
+        repeat (int): Number of timed runs.
+        setup (callable): Called before every run, outside the timed section.
+
+    Returns:
+        dict: Minimum, median and mean run time in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(float(np.median(samples)), 3),
+        'mean_ms': round(float(np.mean(samples)), 3),
+    }
+
+
+def peak_memory(func):
+    """
+    Measure the peak memory allocated while running a function, NumPy buffers included.
+
+    Args:
+        func (callable): The function to measure.
+
+    Returns:
+        int: Peak traced memory in bytes.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def fresh_subdivision(iterations):
+    # Subdivide from the base icosahedron, bypassing the mesh cache
+    return geometry.subdivide(geometry.rotate_around_z(geometry.BASE_VERTICES, geometry.INITIAL_THETA_Z),
+                              geometry.BASE_FACES, iterations)
+
+
+def invalidate_view(globe):
+    # Forget the cached frame so the next read rebuilds it from scratch
+    globe._frame = None
+    globe._frame_key = None
+
+
+def benchmark_preset(iteration_name, repeat, compact=False):
+    """
+    Benchmark mesh build, transform, culling, rendering, lookups and pathfinding for one ITERATIONS preset.
+
+    Args:
+        iteration_name (str): Key into Icosphere.ITERATIONS. A preset over the mesh memory budget is benchmarked as
+            the preset the globe downgrades it to, recorded under 'mapsize'.
+        repeat (int): Number of timed runs per stage.
+        compact (bool): Benchmark the compact mesh storage.
+
+    Returns:
+        dict: Timings per stage, peak memory and the mesh footprint.
+
+    Raises:
+        MeshBudgetExceeded: If the preset does not fit in the memory budget and cannot be downgraded.
+    """
+    # Check the budget before anything is built, and time the mesh that will actually be built
+    iteration_name = geometry.fit_memory_budget(iteration_name, compact)
+    iterations = Icosphere.ITERATIONS[iteration_name]
+    screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    results = {'mapsize': iteration_name, 'iterations': iterations}
+
+    results['subdivide'] = time_call(lambda: fresh_subdivision(iterations), max(1, repeat // 2))
+    results['subdivide']['peak_memory_bytes'] = peak_memory(lambda: fresh_subdivision(iterations))
+
+    globe = Icosphere(iteration_name, compact=compact)
+    results['vertices'] = globe.vertices_count
+    results['faces'] = globe.faces_count
+    results['memory_footprint_bytes'] = globe.memory_footprint
+    results['estimated_memory_bytes'] = geometry.memory_report()[iteration_name]
+    results['construct'] = time_call(lambda: Icosphere(iteration_name, compact=compact), repeat)
+    results['construct']['peak_memory_bytes'] = peak_memory(lambda: Icosphere(iteration_name, compact=compact))
+
+    results['terrain'] = time_call(lambda: terrain.generate(globe.vertices, globe.terrain.seed), max(1, repeat // 2))
+
+    # A drag step followed by the culling and projection it triggers
+    def rotate():
+        globe.rotate_around_x_and_y(0.01, 0.005)
+        globe._frame_buffers()
+    results['rotate_around_x_and_y'] = time_call(rotate, repeat)
+
+    results['_set_initial_zoom_level'] = time_call(globe._set_initial_zoom_level, repeat)
+
+    zoom_levels = {'min_scale': MIN_SCALE, 'initial': globe.scale, 'max_scale': globe.MAX_SCALE}
+    for lod_enabled in (True, False):
+        globe.lod_enabled = lod_enabled
+        mode = 'lod' if lod_enabled else 'finest'
+        for zoom_name, scale in zoom_levels.items():
+            globe.scale = scale
+
+            def counters():
+                return globe.drawn_vertices_count, globe.drawn_faces_count
+
+            # Cold: the view changed, so culling and projection run again. Warm: only the cached frame is read.
+            results['draw_{}_{}'.format(mode, zoom_name)] = time_call(
+                lambda: globe.draw(screen), repeat, setup=lambda: invalidate_view(globe))
+            results['draw_{}_{}'.format(mode, zoom_name)]['drawn_faces'] = len(
+                globe._frame_buffers()['visible_faces'])
+            results['counters_cold_{}_{}'.format(mode, zoom_name)] = time_call(
+                counters, repeat, setup=lambda: invalidate_view(globe))
+            results['counters_warm_{}_{}'.format(mode, zoom_name)] = time_call(counters, repeat)
+
+    # Every render mode with every backend, at the default level of detail. Both draw the same frame, so the
+    # difference is the cost of getting the shapes into the surface.
+    globe.lod_enabled = True
+    for render_mode in Icosphere.RENDER_MODES:
+        globe.render_mode = render_mode
+        for render_backend in Icosphere.RENDER_BACKENDS:
+            globe.render_backend = render_backend
+            for zoom_name, scale in zoom_levels.items():
+                globe.scale = scale
+                results['draw_{}_{}_{}'.format(render_mode, render_backend, zoom_name)] = time_call(
+                    lambda: globe.draw(screen), repeat, setup=lambda: invalidate_view(globe))
+
+    results['draw_peak_memory_bytes'] = peak_memory(lambda: (invalidate_view(globe), globe.draw(screen)))
+
+    # Geographic lookups, e.g. placing thousands of cities at once
+    rng = np.random.default_rng(0)
+    lat = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, 10000)))
+    lon = rng.uniform(-180.0, 180.0, 10000)
+    results['locate_10k'] = time_call(lambda: globe.locate(lat, lon), repeat)
+
+    # Pathfinding between land tiles: a distance field from several units at once, and an uncached path from the
+    # first unit to the furthest tile it reaches
+    pathfinder = globe.pathfinder
+    land = np.flatnonzero(np.isfinite(pathfinder.costs))
+    if len(land):
+        units = np.random.default_rng(0).choice(land, 8)
+        results['distance_field'] = time_call(lambda: pathfinder.distance_field(units), repeat)
+        distances, nearest = pathfinder.distance_field(units)
+        reached = np.flatnonzero(nearest == 0)
+        goal = reached[np.argmax(distances[reached])]
+        results['find_path'] = time_call(lambda: pathfinder.find_path(units[0], goal), repeat,
+                                         setup=pathfinder._paths.clear)
+        results['find_path']['path_length'] = len(pathfinder.find_path(units[0], goal))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the icosphere for every ITERATIONS preset.')
+    parser.add_argument('--presets', nargs='+', default=list(Icosphere.ITERATIONS),
+                        choices=list(Icosphere.ITERATIONS), help='Presets to benchmark (default: all).')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per stage (default: 5).')
+    parser.add_argument('--compact', action='store_true', help='Use compact float32 and narrow index storage.')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file to write the results to.')
+    args = parser.parse_args()
+
+    pygame.init()
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pygame': pygame.version.ver,
+        'screen': [SCREEN_WIDTH, SCREEN_HEIGHT],
+        'compact': args.compact,
+        'presets': {},
+    }
+    for iteration_name in args.presets:
+        print('Benchmarking {}...'.format(iteration_name))
+        try:
+            results = benchmark_preset(iteration_name, args.repeat, args.compact)
+        except geometry.MeshBudgetExceeded as e:
+            print('Skipping {}: {}'.format(iteration_name, e))
+            continue
+        if results['mapsize'] != iteration_name:
+            print('{} is over the mesh memory budget, benchmarked as {}'.format(iteration_name, results['mapsize']))
+        report['presets'][iteration_name] = results
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to {}'.format(args.output))
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,64 @@
 # Constants for screen width and height and scaling
 SCREEN_WIDTH = 1024
 SCREEN_HEIGHT = 768
+
+# Directory for generated meshes, so each ITERATIONS preset is only subdivided once
+MESH_CACHE_DIR = 'cache'
+
+# Frame limiter, and how long an idle main loop sleeps waiting for input before drawing another frame
+MAX_FPS = 60
+IDLE_WAIT_MS = 250
+
+# Level of detail: faces are only refined until they are roughly this many pixels across on screen
+LOD_ENABLED = True
+LOD_TRIANGLE_SIZE = 24
+
+# Presets with at least this many subdivision iterations are built by a process pool, one base face per task, when
+# it has at least PARALLEL_BUILD_MIN_WORKERS workers: each one is several times slower than the serial build, so
+# fewer cores build faster serially. PARALLEL_BUILD_WORKERS = None uses every CPU core.
+PARALLEL_BUILD_MIN_ITERATIONS = 10
+PARALLEL_BUILD_MIN_WORKERS = 4
+PARALLEL_BUILD_WORKERS = None
+
+# Compact mesh storage: float32 positions and the narrowest unsigned integer type that can hold the indices
+COMPACT_MESH = False
+
+# Presets whose estimated mesh footprint is over this budget are either downgraded to the largest preset that
+# fits, or refused with MeshBudgetExceeded ('downgrade' or 'refuse')
+MESH_MEMORY_BUDGET_MB = 4096
+MESH_BUDGET_POLICY = 'downgrade'
+
+# Procedural terrain: the seed new planets are generated from, and the elevation of the sea, from -1 to 1
+TERRAIN_SEED = 1
+TERRAIN_SEA_LEVEL = 0.1
+
+# Globe rendering: 'wireframe' outlines, or 'filled' faces colored by terrain and Lambert shaded. The light comes
+# from LIGHT_DIRECTION in view space (x right, y up, z towards the viewer), and AMBIENT_LIGHT is the brightness of
+# faces turned away from it.
+RENDER_MODE = 'wireframe'
+LIGHT_DIRECTION = (-0.4, 0.5, 0.75)
+AMBIENT_LIGHT = 0.3
+
+# What draws the globe: 'pygame' calls pygame.draw once per line or face, 'numpy' rasterizes whole batches into the
+# surface's pixels (see rasterizer). numpy draws wireframes faster once a few thousand edges are on screen, but it
+# fills faces pixel by pixel, which is slower than pygame's polygon fill at every zoom with LOD_ENABLED and only
+# pays off with tens of thousands of faces on screen. Compare them per preset with benchmark.py and override the
+# default for a preset in RENDER_BACKEND_BY_PRESET, e.g. {'Huge': 'numpy'}.
+RENDER_BACKEND = 'pygame'
+RENDER_BACKEND_BY_PRESET = {}
+
+# Rendered text surfaces kept for reuse, least recently used first out
+TEXT_CACHE_SIZE = 256
+
+# Saved games: the directory they are written to, and the zlib level of their layers (1 is fastest, 9 smallest)
+SAVE_DIR = 'saves'
+SAVE_COMPRESSION_LEVEL = 1
+
+# Shortest paths between globe nodes kept for reuse, least recently used first out
+PATH_CACHE_SIZE = 128
+
+# Frame profiling, shown in the debug menu's Console tab: whether it records from the start, how many frames it keeps,
+# and where traces are written
+PROFILER_ENABLED = False
+PROFILER_HISTORY = 300
+PROFILER_TRACE_FILE = 'profile_trace.json'
@@ -0,0 +1,53 @@
+import functools
+import pygame
+from config import TEXT_CACHE_SIZE
+
+# Shared fonts and rendered text.
+#
+# Opening a font parses its TTF file, and rendering text rasterizes every glyph, so neither should happen every
+# frame. Each font face and size is loaded once and kept, and rendered text surfaces are kept in an LRU cache
+# keyed by font, text and color, so UI that does not change only costs a blit. The cached surfaces are shared and
+# must not be drawn on.
+
+FONT_REGULAR = 'assets/fonts/Urbanist-Regular.ttf'
+FONT_BOLD = 'assets/fonts/Urbanist-Bold.ttf'
+FONT_LIGHT = 'assets/fonts/Urbanist-Light.ttf'
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(path, size):
+    """
+    Get a font, loading it on first use.
+
+    Args:
+        path (str): Path of the font file, or None for pygame's default font.
+        size (int): Font size.
+
+    Returns:
+        pygame.font.Font: The shared font.
+    """
+    return pygame.font.Font(path, size)
+
+
+@functools.lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(path, size, text, color, antialias=True):
+    """
+    Render a line of text, reusing the surface if the same text was rendered recently.
+
+    Args:
+        path (str): Path of the font file, or None for pygame's default font.
+        size (int): Font size.
+        text (str): The text.
+        color (tuple): The RGB text color.
+        antialias (bool): Whether to antialias the glyphs.
+
+    Returns:
+        pygame.Surface: The rendered text. It is shared with other callers, so only blit it.
+    """
+    return get_font(path, size).render(text, antialias, color)
+
+
+def clear():
+    # Forget every font and rendered text, e.g. before pygame.font is shut down
+    render_text.cache_clear()
+    get_font.cache_clear()
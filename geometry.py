@@ -0,0 +1,735 @@
+import os
+import numpy as np
+import mesh_cache
+import parallel_subdivision
+import adjacency
+from config import (PARALLEL_BUILD_MIN_ITERATIONS, PARALLEL_BUILD_MIN_WORKERS, PARALLEL_BUILD_WORKERS,
+                    MESH_MEMORY_BUDGET_MB, MESH_BUDGET_POLICY)
+
+# Geometry core of the globe: the icosahedron, its subdivision into the mesh of every preset, the tables derived from
+# the mesh, and the projection math. It only needs NumPy, so mesh generation can run in worker processes and on
+# build servers without pygame; Icosphere adds the screen, the view and the rendering on top of it.
+
+
+class BuildCancelled(Exception):
+    """Raised by a mesh build when its progress callback finds the build has been cancelled."""
+
+
+class MeshBudgetExceeded(MemoryError):
+    """Raised when no acceptable preset fits within the mesh memory budget."""
+
+
+# Vertices of the icosahedron
+PHI = (1.0 + np.sqrt(5.0)) / 2.0
+BASE_VERTICES = np.array([
+    [-1, PHI, 0],
+    [1, PHI, 0],
+    [-1, -PHI, 0],
+    [1, -PHI, 0],
+
+    [0, -1, PHI],
+    [0, 1, PHI],
+    [0, -1, -PHI],
+    [0, 1, -PHI],
+
+    [PHI, 0, -1],
+    [PHI, 0, 1],
+    [-PHI, 0, -1],
+    [-PHI, 0, 1],
+])
+
+# Faces of the icosahedron
+BASE_FACES = np.array([
+    # 5 faces around point 0
+    [0, 11, 5],
+    [0, 5, 1],
+    [0, 1, 7],
+    [0, 7, 10],
+    [0, 10, 11],
+
+    # 5 adjacent faces
+    [1, 5, 9],
+    [5, 11, 4],
+    [11, 10, 2],
+    [10, 7, 6],
+    [7, 1, 8],
+
+    # 5 faces around point 3
+    [3, 9, 4],
+    [3, 4, 2],
+    [3, 2, 6],
+    [3, 6, 8],
+    [3, 8, 9],
+
+    # 5 adjacent faces
+    [4, 9, 5],
+    [2, 4, 11],
+    [6, 2, 10],
+    [8, 6, 7],
+    [9, 8, 1],
+])
+
+# Subdivision iterations of every map size preset
+ITERATIONS = {
+    'Debug': 0,
+    'Tiny': 4,
+    'Small': 6,
+    'Normal': 8,
+    'Large': 10,
+    'Huge': 12
+}
+
+# Bump this whenever the subdivision output changes, so stale cached meshes are not loaded
+SUBDIVISION_VERSION = 3
+
+# Rotation around the z-axis that puts the icosahedron's poles at the top and bottom
+INITIAL_THETA_Z = -np.pi / 6
+
+
+def vertex_count(iterations):
+    return 10 * 4 ** iterations + 2
+
+
+def face_count(iterations):
+    return 20 * 4 ** iterations
+
+
+def edge_count(iterations):
+    return 30 * 4 ** iterations
+
+
+def index_dtype(count):
+    """
+    Get the narrowest unsigned integer type that can index count items.
+
+    Args:
+        count (int): Number of items.
+
+    Returns:
+        numpy.dtype: The index type.
+    """
+    return np.min_scalar_type(max(count - 1, 0))
+
+
+def estimate_memory(iteration_name, compact=False):
+    """
+    Estimate the memory taken by the mesh arrays and terrain of a preset, without building it.
+
+    Args:
+        iteration_name (str): Key into ITERATIONS.
+        compact (bool): Estimate for compact storage instead of float64 and int64.
+
+    Returns:
+        int: The footprint in bytes.
+    """
+    iterations = ITERATIONS[iteration_name]
+    vertices = vertex_count(iterations)
+    faces = face_count(iterations)
+    edges = edge_count(iterations)
+    coarse_faces = sum(face_count(level) for level in range(iterations))
+
+    float_size = 4 if compact else 8
+    vertex_index_size = index_dtype(vertices).itemsize if compact else 8
+    face_index_size = index_dtype(faces).itemsize if compact else 8
+    vertex_vertices_indptr_size = index_dtype(2 * edges + 1).itemsize if compact else 8
+    face_corners_indptr_size = index_dtype(3 * faces + 1).itemsize if compact else 8
+
+    return (vertices * 3 * float_size +
+            (faces + coarse_faces) * 3 * vertex_index_size +
+            (faces + coarse_faces) * 4 * float_size +
+            8 +  # max_edge_length
+            (vertices + 1) * vertex_vertices_indptr_size + 2 * edges * vertex_index_size +
+            (vertices + 1) * face_corners_indptr_size + 3 * faces * face_index_size +
+            (faces + 1) * face_corners_indptr_size + 3 * faces * face_index_size +
+            vertices * (4 + 1 + 1))  # terrain elevation, land and biome
+
+
+def estimate_build_memory(iteration_name, compact=False, parallel=None):
+    """
+    Estimate the peak memory of building the mesh of a preset.
+
+    The build works in float64 and int64, and a compact build narrows each array as soon as it is done with it. A
+    standard build peaks at the end, on the finest level's bounding caps: every finished array plus about three
+    (F, 3) float64 temporaries. A compact build peaks earlier, on the adjacency relations: the full width vertices,
+    faces and face edges, the relations as int64, and about three (F, 3) int64 temporaries of the walk around the
+    vertices.
+
+    The parallel build also holds its output arrays in shared memory, first while the workers each subdivide one
+    base face and then while the arrays are copied out in the serial build's vertex order.
+
+    Args:
+        iteration_name (str): Key into ITERATIONS.
+        compact (bool): Whether the mesh will use compact storage.
+        parallel (bool): Whether the mesh is built in parallel. Defaults to uses_parallel_build.
+
+    Returns:
+        int: The peak in bytes.
+    """
+    iterations = ITERATIONS[iteration_name]
+    vertices = vertex_count(iterations)
+    faces = face_count(iterations)
+    edges = edge_count(iterations)
+
+    temporaries = 3 * 3 * 8 * faces
+    if compact:
+        relations = ((vertices + 1) + 2 * edges + (vertices + 1) + 3 * faces + (faces + 1) + 3 * faces) * 8
+        peak = vertices * 3 * 8 + 2 * faces * 3 * 8 + relations + temporaries
+    else:
+        peak = estimate_memory(iteration_name) + temporaries
+
+    if parallel is None:
+        parallel = uses_parallel_build(iterations)
+    if parallel:
+        # The shared vertices, faces, edges and face edges, as parallel_subdivision sizes them. Each worker peaks
+        # at about 24 int64 per face of its base face.
+        vertex_index_size = index_dtype(vertices).itemsize if compact else 8
+        edge_index_size = index_dtype(edges).itemsize if compact else 8
+        shared = vertices * 3 * 8 + (faces * 3 + edges * 2) * vertex_index_size + faces * 3 * edge_index_size
+        workers = min(parallel_workers(), len(BASE_FACES))
+        peak = max(peak, shared + workers * 24 * 8 * faces // len(BASE_FACES), 2 * shared + 2 * 8 * vertices)
+    return peak
+
+
+def fit_memory_budget(iteration_name, compact=False):
+    """
+    Check a preset against MESH_MEMORY_BUDGET_MB, downgrading it if MESH_BUDGET_POLICY allows. A preset fits when
+    the finished mesh does and, unless its mesh is already cached, the peak of building it does too.
+
+    Args:
+        iteration_name (str): Key into ITERATIONS.
+        compact (bool): Whether the mesh will use compact storage.
+
+    Returns:
+        str: The preset to build: iteration_name, or the largest smaller preset that fits.
+
+    Raises:
+        MeshBudgetExceeded: If the preset does not fit and the policy is 'refuse', or if no preset fits.
+    """
+    budget = MESH_MEMORY_BUDGET_MB * 1024 * 1024
+
+    def needed(name):
+        # A cached mesh is mapped straight in, without the build's peak
+        footprint = estimate_memory(name, compact)
+        if mesh_cache.has_arrays(mesh_cache_key(name, compact), mesh_array_names(ITERATIONS[name])):
+            return footprint
+        return max(footprint, estimate_build_memory(name, compact))
+
+    if needed(iteration_name) <= budget:
+        return iteration_name
+
+    if MESH_BUDGET_POLICY == 'downgrade':
+        smaller = [name for name, iterations in ITERATIONS.items()
+                   if iterations < ITERATIONS[iteration_name] and needed(name) <= budget]
+        if smaller:
+            return max(smaller, key=ITERATIONS.get)
+
+    raise MeshBudgetExceeded('The {} map needs about {:.0f} MB, over the {} MB budget.'.format(
+        iteration_name, needed(iteration_name) / 1024 / 1024, MESH_MEMORY_BUDGET_MB))
+
+
+def memory_report():
+    """
+    Get the estimated mesh footprint of every preset, with standard and compact storage, and the peak of building it
+    for each.
+
+    Returns:
+        dict: {preset: {'standard': bytes, 'compact': bytes, 'build': bytes, 'compact_build': bytes}}.
+    """
+    return {name: {'standard': estimate_memory(name), 'compact': estimate_memory(name, True),
+                   'build': estimate_build_memory(name), 'compact_build': estimate_build_memory(name, True)}
+            for name in ITERATIONS}
+
+
+def mesh_stats(arrays):
+    """
+    Summarize a mesh.
+
+    Args:
+        arrays (dict): The mesh arrays, as from load_or_build_mesh.
+
+    Returns:
+        dict: Vertex, face and edge counts, the longest edge, and the bytes taken by the arrays.
+    """
+    return {
+        'vertices': len(arrays['vertices']),
+        'faces': len(arrays['faces']),
+        'edges': len(arrays['vertex_vertices_indices']) // 2,
+        'max_edge_length': float(arrays['max_edge_length'][0]),
+        'nbytes': sum(array.nbytes for array in arrays.values()),
+    }
+
+
+def parallel_workers():
+    return PARALLEL_BUILD_WORKERS or os.cpu_count() or 1
+
+
+def uses_parallel_build(iterations):
+    # Each worker of the parallel build is several times slower than the serial build, so it only pays off on
+    # large presets with enough cores to share them between
+    return iterations >= PARALLEL_BUILD_MIN_ITERATIONS and parallel_workers() >= PARALLEL_BUILD_MIN_WORKERS
+
+
+def mesh_cache_key(iteration_name, compact=False):
+    return '{}{}-v{}'.format(iteration_name.lower(), '-compact' if compact else '', SUBDIVISION_VERSION)
+
+
+def mesh_array_names(iterations):
+    # Every level above the finest keeps its own faces; every level including the finest has bounding caps
+    return (['vertices', 'faces', 'max_edge_length'] + adjacency.array_names() +
+            ['faces_l{}'.format(level) for level in range(iterations)] +
+            ['caps_l{}'.format(level) for level in range(iterations + 1)])
+
+
+def load_or_build_mesh(iteration_name, compact=False, progress_callback=None):
+    """
+    Load the mesh for a preset from the on-disk cache, building and caching it on the first use.
+
+    Args:
+        iteration_name (str): Key into ITERATIONS.
+        compact (bool): Store the mesh as float32 and narrow integers.
+        progress_callback (callable): Called with the fraction of a build done. It may raise to stop the build.
+
+    Returns:
+        dict: The mesh arrays, named as in mesh_array_names and memory mapped when they come from the cache.
+    """
+    iterations = ITERATIONS[iteration_name]
+    key = mesh_cache_key(iteration_name, compact)
+    arrays = mesh_cache.load_arrays(key, mesh_array_names(iterations))
+    if arrays is None:
+        arrays = build_mesh(iterations, compact, progress_callback)
+        mesh_cache.save_arrays(key, arrays)
+    return arrays
+
+
+def build_mesh(iterations, compact=False, progress_callback=None, parallel=None):
+    """
+    Subdivide the base icosahedron and derive the tables the renderer and gameplay need.
+
+    Args:
+        iterations (int): Number of subdivision iterations.
+        compact (bool): Convert the arrays to compact storage, as in compact_arrays.
+        progress_callback (callable): Called with the fraction of the build done. It may raise to stop the build.
+        parallel (bool): Subdivide with a process pool, one base face per task. Defaults to uses_parallel_build.
+            Both builds give the same mesh.
+
+    Returns:
+        dict: The mesh arrays, named as in mesh_array_names.
+    """
+    def report(fraction):
+        if progress_callback is not None:
+            progress_callback(fraction)
+
+    # Initial rotation to align the poles
+    vertices = rotate_around_z(BASE_VERTICES, INITIAL_THETA_Z)
+
+    # Subdivision iterations, split across processes by base face for the largest presets. The parallel build
+    # numbers its edges as it goes, so it also returns the edge table of the final mesh.
+    if parallel is None:
+        parallel = uses_parallel_build(iterations)
+    if parallel:
+        vertices, faces, edges, face_edges = parallel_subdivision.subdivide(
+            vertices, BASE_FACES, iterations, parallel_workers(), compact=compact,
+            progress_callback=lambda fraction: report(0.8 * fraction))
+    else:
+        vertices, faces = subdivide(vertices, BASE_FACES, iterations,
+                                    progress_callback=lambda fraction: report(0.8 * fraction))
+
+        # Edge table of the final mesh, which the build uses to measure edges and link faces but does not keep
+        edges, face_edges = edge_table(faces)
+    report(0.85)
+
+    # Maximum distance between two vertices of the same face
+    edge_lengths = np.linalg.norm(vertices[edges[:, 0]] - vertices[edges[:, 1]], axis=1)
+    max_edge_length = np.array([edge_lengths.max()], dtype=np.float64)
+    del edge_lengths, edges
+
+    # Arrays go into compact storage as soon as the rest of the build is done with them at full width, so a compact
+    # build never holds two copies of the whole mesh
+    arrays = {}
+
+    def finish(finished):
+        arrays.update(compact_arrays(finished, iterations) if compact else finished)
+
+    finish({'max_edge_length': max_edge_length})
+
+    # Neighbour lookups for gameplay
+    finish(adjacency.build_arrays(len(vertices), faces, face_edges))
+    del face_edges
+    report(0.9)
+
+    for level, level_faces in enumerate(face_hierarchy(faces, iterations)):
+        if level < iterations:
+            finish({'faces_l{}'.format(level): level_faces})
+        finish({'caps_l{}'.format(level): bounding_caps(vertices, level_faces)})
+    finish({'vertices': vertices, 'faces': faces})
+    report(0.95)
+    return arrays
+
+
+def compact_arrays(arrays, iterations):
+    """
+    Convert mesh arrays to compact storage: float32 positions and caps, and the narrowest unsigned integer type for
+    vertex and face indices.
+
+    Args:
+        arrays (dict): Some or all of the mesh arrays, named as in mesh_array_names.
+        iterations (int): Number of subdivision iterations of the mesh, which sizes the index types.
+
+    Returns:
+        dict: The converted arrays.
+    """
+    vertex_index = index_dtype(vertex_count(iterations))
+    face_index = index_dtype(face_count(iterations))
+
+    compact = {}
+    for name, array in arrays.items():
+        if name in ('faces', 'vertex_vertices_indices') or name.startswith('faces_l'):
+            compact[name] = array.astype(vertex_index, copy=False)
+        elif name in ('vertex_faces_indices', 'face_faces_indices'):
+            compact[name] = array.astype(face_index, copy=False)
+        elif name.endswith('_indptr'):
+            compact[name] = array.astype(index_dtype(int(array[-1]) + 1), copy=False)
+        elif name == 'vertices' or name.startswith('caps_l'):
+            compact[name] = array.astype(np.float32, copy=False)
+        else:
+            compact[name] = array
+    return compact
+
+
+def face_hierarchy(faces, iterations):
+    """
+    Recover the faces of every subdivision level from the finest faces.
+
+    Subdivision keeps the vertex indices of coarser levels and writes the children of face f to rows 4f to 4f + 3,
+    with the parent's corners first in the first three children. Parent f of a level therefore owns rows 4f to
+    4f + 3 of the level below it.
+
+    Args:
+        faces (numpy.ndarray): (F, 3) array of the finest faces.
+        iterations (int): Number of subdivision iterations that produced them.
+
+    Returns:
+        list: Face arrays from the 20 base faces (level 0) down to the finest level.
+    """
+    levels = [faces]
+    for _ in range(iterations):
+        children = levels[0]
+        levels.insert(0, np.stack([children[0::4, 0], children[1::4, 0], children[2::4, 0]], axis=1))
+    return levels
+
+
+def bounding_caps(verts, faces):
+    """
+    Compute a bounding cap for every face: a point on the unit sphere and a radius around it that contains the
+    face's corners, and so every vertex its subdivisions can produce.
+
+    Args:
+        verts (numpy.ndarray): (V, 3) array of vertex positions.
+        faces (numpy.ndarray): (F, 3) array of vertex indices.
+
+    Returns:
+        numpy.ndarray: (F, 4) array of cap centers (x, y, z) and radii.
+    """
+    # One corner at a time, to keep the temporary arrays the size of a single corner array
+    centers = verts[faces[:, 0]] + verts[faces[:, 1]] + verts[faces[:, 2]]
+    centers /= np.linalg.norm(centers, axis=1)[:, np.newaxis]
+    radii = np.zeros(len(faces))
+    for corner in range(3):
+        np.maximum(radii, np.linalg.norm(verts[faces[:, corner]] - centers, axis=1), out=radii)
+
+    # Allow for the rounding of float32 vertices and of the caps themselves in compact storage
+    radii += 4 * np.finfo(np.float32).eps
+    return np.concatenate([centers, radii[:, np.newaxis]], axis=1)
+
+
+def subdivide(verts, faces, iterations, progress_callback=None):
+    """
+    Subdivide a mesh several times over.
+
+    Args:
+        verts (numpy.ndarray): (V, 3) array of vertex positions.
+        faces (numpy.ndarray): (F, 3) array of vertex indices.
+        iterations (int): Number of subdivision iterations.
+        progress_callback (callable): Called with the fraction of the work done after every iteration.
+
+    Returns:
+        tuple: The subdivided (vertices, faces) arrays.
+    """
+    for i in range(iterations):
+        verts, faces = subdivide_once(verts, faces)
+
+        # Each iteration costs four times the previous one
+        if progress_callback is not None:
+            progress_callback((4 ** (i + 1) - 1) / (4 ** iterations - 1))
+    return verts, faces
+
+
+def edge_table(faces):
+    """
+    Build the table of unique, undirected edges of a triangle mesh.
+
+    Args:
+        faces (numpy.ndarray): (F, 3) array of vertex indices.
+
+    Returns:
+        tuple: (edges, face_edges) where edges is an (E, 2) array of vertex index pairs with the lower index
+        first, and face_edges is an (F, 3) array mapping each face's ab, bc and ca edge to its row in edges.
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    count = int(faces.max()) + 1
+
+    # Key of the edges ab, bc, ca of every face, from the lower vertex index first so both faces sharing an edge
+    # produce the same key. Worked out in place, as this is the largest temporary of a mesh build.
+    following = np.roll(faces, -1, axis=1)
+    keys = np.minimum(faces, following).ravel()
+    keys *= count
+    keys += np.maximum(faces, following, out=following).ravel()
+    del following
+
+    # Number the unique keys in sorted order, like numpy.unique with return_inverse, with fewer temporaries
+    order = np.argsort(keys)
+    keys = keys[order]
+    starts = np.empty(len(keys), dtype=bool)
+    starts[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=starts[1:])
+    face_edges = np.empty(len(keys), dtype=np.int64)
+    face_edges[order] = np.cumsum(starts) - 1
+    del order
+    keys = keys[starts]
+
+    edges = np.stack([keys // count, keys % count], axis=1)
+    return edges, face_edges.reshape(-1, 3)
+
+
+def subdivide_once(verts, faces, table=None):
+    """
+    Split every face into four, sharing each edge midpoint between the two faces that use it.
+
+    The original vertices keep their indices and the midpoints are appended after them, one per unique edge. The
+    four children of face f are written to rows 4f to 4f + 3.
+
+    Args:
+        verts (numpy.ndarray): (V, 3) array of vertex positions.
+        faces (numpy.ndarray): (F, 3) array of vertex indices.
+        table (tuple): The (edges, face_edges) of faces, if the caller has already built them.
+
+    Returns:
+        tuple: The subdivided (vertices, faces) arrays.
+    """
+    edges, face_edges = edge_table(faces) if table is None else table
+
+    # Calculate the midpoints and push them out to the sphere's surface
+    midpoints = verts[edges[:, 0]] + verts[edges[:, 1]]
+    midpoints /= np.linalg.norm(midpoints, axis=1)[:, np.newaxis]
+
+    # Normalize the original vertices to ensure they are on the sphere's surface
+    originals = verts / np.linalg.norm(verts, axis=1)[:, np.newaxis]
+    new_vertices = np.concatenate([originals, midpoints])
+
+    # Midpoint indices for the ab, bc and ca edges of every face
+    mid = face_edges + len(verts)
+    ab, bc, ca = mid[:, 0], mid[:, 1], mid[:, 2]
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+
+    # Create 4 new faces per face
+    new_faces = np.stack([
+        np.stack([a, ab, ca], axis=1),
+        np.stack([b, bc, ab], axis=1),
+        np.stack([c, ca, bc], axis=1),
+        np.stack([ab, bc, ca], axis=1),
+    ], axis=1).reshape(-1, 3)
+
+    return new_vertices, new_faces
+
+
+def rotate_around_z(verts, theta_z):
+    """
+    Rotate vertices around the z-axis (depth, in to and out of the screen).
+
+    Args:
+        verts (numpy.ndarray): (N, 3) array of vertices.
+        theta_z (float): Rotation angle.
+
+    Returns:
+        numpy.ndarray: Rotated vertices.
+    """
+    rotation_matrix_z = np.array([
+        [np.cos(theta_z), -np.sin(theta_z), 0],
+        [np.sin(theta_z), np.cos(theta_z), 0],
+        [0, 0, 1]
+    ])
+
+    return np.dot(verts, rotation_matrix_z)
+
+
+def rotation_matrix_y(theta_y):
+    return np.array([
+        [np.cos(theta_y), 0, np.sin(theta_y)],
+        [0, 1, 0],
+        [-np.sin(theta_y), 0, np.cos(theta_y)]
+    ])
+
+
+def rotation_matrix_x(theta_x):
+    return np.array([
+        [1, 0, 0],
+        [0, np.cos(theta_x), -np.sin(theta_x)],
+        [0, np.sin(theta_x), np.cos(theta_x)]
+    ])
+
+
+def orientation(theta_y, theta_x):
+    """
+    Get the matrix that turns the globe around its polar axis and then tilts it around the screen's x-axis.
+
+    Args:
+        theta_y (float): Angle around the polar (y) axis.
+        theta_x (float): Tilt angle around the x-axis.
+
+    Returns:
+        numpy.ndarray: 3x3 matrix taking model space vertices (as row vectors) to view space.
+    """
+    return np.dot(rotation_matrix_y(theta_y), rotation_matrix_x(theta_x))
+
+
+def project(verts, scale, center):
+    """
+    Project view space vertices onto 2D with an orthographic projection, y pointing down as on screen.
+
+    Args:
+        verts (numpy.ndarray): (N, 3) array of vertices.
+        scale (float): Pixels per unit of length.
+        center (tuple): (x, y) position the origin projects to.
+
+    Returns:
+        numpy.ndarray: (N, 2) integer array of positions.
+    """
+    projected = np.empty((len(verts), 2), dtype=np.int64)
+    projected[:, 0] = verts[:, 0] * scale + center[0]
+    projected[:, 1] = -verts[:, 1] * scale + center[1]
+    return projected
+
+
+def latlon_to_points(lat, lon):
+    """
+    Convert geographic coordinates to points on the unit sphere. The y-axis is the polar axis, with the north pole
+    at +y, and longitude 0 lies along +z, increasing towards +x.
+
+    Args:
+        lat (numpy.ndarray): Latitudes in degrees.
+        lon (numpy.ndarray): Longitudes in degrees, broadcast against lat.
+
+    Returns:
+        numpy.ndarray: (N, 3) float64 array of points.
+    """
+    lat, lon = np.broadcast_arrays(np.radians(np.asarray(lat, dtype=np.float64)),
+                                   np.radians(np.asarray(lon, dtype=np.float64)))
+    lat, lon = lat.ravel(), lon.ravel()
+    points = np.empty((len(lat), 3))
+    points[:, 0] = np.cos(lat) * np.sin(lon)
+    points[:, 1] = np.sin(lat)
+    points[:, 2] = np.cos(lat) * np.cos(lon)
+    return points
+
+
+def points_to_latlon(points):
+    """
+    Convert points to geographic coordinates, the inverse of latlon_to_points.
+
+    Args:
+        points (numpy.ndarray): (N, 3) array of points. They need not be normalized.
+
+    Returns:
+        tuple: (lat, lon), two (N,) float64 arrays in degrees, longitudes from -180 to 180.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    lat = np.arctan2(points[:, 1], np.hypot(points[:, 0], points[:, 2]))
+    lon = np.arctan2(points[:, 0], points[:, 2])
+    return np.degrees(lat), np.degrees(lon)
+
+
+def _edge_normals(corners):
+    # Normals of the great circles through each corner of (..., 3, 3) triangles and the next corner, pointing into
+    # the triangle whichever way it is wound
+    normals = np.cross(corners, corners[..., [1, 2, 0], :])
+    winding = np.sign(np.einsum('...j,...j->...', normals[..., 0, :], corners[..., 2, :]))
+    return normals * winding[..., np.newaxis, np.newaxis]
+
+
+def locate_faces(points, verts, level_faces):
+    """
+    Find the face of the finest level containing each point, by descending from the 20 base faces.
+
+    Subdivision splits every face into 4 children that exactly cover it on the sphere, so the face hierarchy serves
+    as the spatial index: each level only has to tell which child of the face found on the level above a point is
+    in. The children of face f are its three corners' triangles (rows 4f to 4f + 2) around the triangle joining its
+    edge midpoints (row 4f + 3), so the three edges of that middle child decide it.
+
+    Args:
+        points (numpy.ndarray): (N, 3) array of points on the unit sphere.
+        verts (numpy.ndarray): (V, 3) array of mesh vertices.
+        level_faces (list): Faces of every subdivision level, base faces first and the finest level last.
+
+    Returns:
+        numpy.ndarray: (N,) array of face indices into the finest level.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    rows = np.arange(len(points))
+
+    # The base face each point is furthest inside of, by the nearest of its three edges
+    normals = _edge_normals(verts[np.asarray(level_faces[0])].astype(np.float64))
+    margins = np.dot(points, normals.reshape(-1, 3).T).reshape(len(points), len(normals), 3)
+    faces = np.argmax(np.minimum(np.minimum(margins[..., 0], margins[..., 1]), margins[..., 2]), axis=1)
+
+    for level in range(1, len(level_faces)):
+        # The edges of the middle child (ab to bc, bc to ca, ca to ab) cut off the children at corners b, c and a,
+        # so a point outside an edge is in the child numbered one past it, and otherwise in the middle child
+        middle = 4 * faces + 3
+        normals = _edge_normals(verts[level_faces[level][middle]].astype(np.float64))
+        margins = np.einsum('nej,nj->ne', normals, points)
+        outside = np.argmin(margins, axis=1)
+        faces = 4 * faces + np.where(margins[rows, outside] < 0, (outside + 1) % 3, 3)
+    return faces
+
+
+def nearest_vertices(points, verts, faces, face_ids, vertex_adjacency):
+    """
+    Find the vertex nearest to each point, i.e. the tile it lies on.
+
+    Starts from the nearest corner of the face containing the point, which is almost always the answer, and walks to
+    any closer neighbouring vertex until none is closer. The walks of all points advance together, one step at a
+    time, and points drop out as they settle.
+
+    Args:
+        points (numpy.ndarray): (N, 3) array of points on the unit sphere.
+        verts (numpy.ndarray): (V, 3) array of mesh vertices.
+        faces (numpy.ndarray): (F, 3) array of the finest level's faces.
+        face_ids (numpy.ndarray): (N,) faces containing the points, as from locate_faces.
+        vertex_adjacency (adjacency.Adjacency): Neighbours of every vertex.
+
+    Returns:
+        numpy.ndarray: (N,) array of vertex indices.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    corners = faces[face_ids].astype(np.int64)
+    nearest = np.argmax(np.einsum('ijk,ik->ij', verts[corners], points), axis=1)
+    result = corners[np.arange(len(corners)), nearest]
+
+    indptr, indices = np.asarray(vertex_adjacency.indptr), np.asarray(vertex_adjacency.indices)
+    active = np.arange(len(points))
+    while len(active):
+        # Each active point's current vertex followed by its neighbours, repeating the last one where it has fewer
+        # than adjacency.MAX_DEGREE
+        current = result[active]
+        starts = indptr[current].astype(np.int64)
+        counts = indptr[current + 1].astype(np.int64) - starts
+        offsets = np.minimum(np.arange(adjacency.MAX_DEGREE), counts[:, np.newaxis] - 1)
+        candidates = np.concatenate([current[:, np.newaxis], indices[starts[:, np.newaxis] + offsets]], axis=1)
+
+        # Ties keep the current vertex, which comes first, so the walk always ends
+        closest = np.argmax(np.einsum('ijk,ik->ij', verts[candidates].astype(np.float64), points[active]), axis=1)
+        best = candidates[np.arange(len(active)), closest]
+        moved = closest > 0
+        result[active] = best
+        active = active[moved]
+    return result
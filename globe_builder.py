@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from icosphere import Icosphere
+from geometry import BuildCancelled, MeshBudgetExceeded
+import savegame
+
+
+class GlobeBuilder:
+    """
+    Builds or loads Icospheres on a worker thread, so the main loop keeps pumping events and drawing while a globe
+    is generated. Only the most recently requested build is kept; starting a new one cancels the previous one.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._future = None
+        self._cancel_event = None
+        self.iteration_name = None
+        self.status = None
+        self.progress = 0.0
+        self.error = None
+
+    def start(self, iteration_name):
+        """
+        Start building a globe in the background, cancelling any build still in flight.
+
+        Args:
+            iteration_name (str): Key into Icosphere.ITERATIONS.
+        """
+        self._submit(iteration_name, "Generating {} planet...".format(iteration_name),
+                     lambda report, cancel_event: Icosphere(iteration_name, progress_callback=report,
+                                                            cancel_event=cancel_event))
+
+    def start_load(self, path):
+        """
+        Start loading a saved globe in the background, cancelling any build still in flight.
+
+        Args:
+            path (str): The save, as written by savegame.save.
+        """
+        try:
+            iteration_name = savegame.read_header(path)['mapsize']
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+            return
+        self._submit(iteration_name, "Loading {} planet...".format(iteration_name),
+                     lambda report, cancel_event: savegame.load(path, progress_callback=report,
+                                                                cancel_event=cancel_event))
+
+    def _submit(self, iteration_name, status, factory):
+        self.cancel()
+        self.iteration_name = iteration_name
+        self.status = status
+        self.progress = 0.0
+        self.error = None
+        self._cancel_event = threading.Event()
+        self._future = self._executor.submit(self._build, factory, self._cancel_event)
+
+    def _build(self, factory, cancel_event):
+        def report(fraction):
+            # A cancelled build keeps running until its next check; don't let it overwrite the new build's progress
+            if not cancel_event.is_set():
+                self.progress = fraction
+        return factory(report, cancel_event)
+
+    def cancel(self):
+        # Ask the in-flight build to stop at its next progress check, and forget about it
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+        self._future = None
+        self._cancel_event = None
+
+    @property
+    def busy(self):
+        return self._future is not None
+
+    def poll(self):
+        """
+        Check whether the current build has finished.
+
+        Returns:
+            Icosphere: The finished globe, or None if there is no build, it is still running, or it failed. A
+            build refused by the mesh memory budget, a save that cannot be loaded, or any other failure leaves its
+            reason in error.
+        """
+        if self._future is None or not self._future.done():
+            return None
+
+        future = self._future
+        self._future = None
+        self._cancel_event = None
+        try:
+            return future.result()
+        except BuildCancelled:
+            return None
+        except (MeshBudgetExceeded, savegame.SaveFormatError) as e:
+            self.error = str(e)
+            return None
+        except Exception as e:
+            # Anything else the worker raised, such as an unreadable file, is reported the same way rather than
+            # ending the main loop
+            self.error = '{} failed: {}'.format(self.status.rstrip('.'), e)
+            return None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -1,6 +1,15 @@
 import pygame
 import numpy as np
-from config import SCREEN_WIDTH, SCREEN_HEIGHT
+import geometry
+import adjacency
+import terrain
+import rasterizer
+from tiles import TileLayer
+from pathfinding import Pathfinder
+from profiler import frame_profiler
+from geometry import BuildCancelled
+from config import (SCREEN_WIDTH, SCREEN_HEIGHT, LOD_ENABLED, LOD_TRIANGLE_SIZE, COMPACT_MESH, TERRAIN_SEED,
+                    RENDER_MODE, RENDER_BACKEND, RENDER_BACKEND_BY_PRESET, LIGHT_DIRECTION, AMBIENT_LIGHT)
 
 
 # Constants for centering the icosahedron on the screen
@@ -11,126 +20,122 @@ MIN_SCALE = 350
 
 
 class Icosphere:
-    MAX_SCALE = None  # Will be dynamically set later
-
-    # Define the vertices for an icosahedron
-    phi = (1.0 + np.sqrt(5.0)) / 2.0
-    vertices = np.array([
-        [-1, phi, 0],
-        [1, phi, 0],
-        [-1, -phi, 0],
-        [1, -phi, 0],
-
-        [0, -1, phi],
-        [0, 1, phi],
-        [0, -1, -phi],
-        [0, 1, -phi],
-
-        [phi, 0, -1],
-        [phi, 0, 1],
-        [-phi, 0, -1],
-        [-phi, 0, 1],
-    ])
-
-    # Faces for the icosahedron
-    faces = np.array([
-        # 5 faces around point 0
-        [0, 11, 5],
-        [0, 5, 1],
-        [0, 1, 7],
-        [0, 7, 10],
-        [0, 10, 11],
-
-        # 5 adjacent faces
-        [1, 5, 9],
-        [5, 11, 4],
-        [11, 10, 2],
-        [10, 7, 6],
-        [7, 1, 8],
-
-        # 5 faces around point 3
-        [3, 9, 4],
-        [3, 4, 2],
-        [3, 2, 6],
-        [3, 6, 8],
-        [3, 8, 9],
-
-        # 5 adjacent faces
-        [4, 9, 5],
-        [2, 4, 11],
-        [6, 2, 10],
-        [8, 6, 7],
-        [9, 8, 1],
-    ])
-
-    ITERATIONS = {
-        'Debug': 0,
-        'Tiny': 4,
-        'Small': 6,
-        'Normal': 8,
-        'Large': 10,
-        'Huge': 12
-    }
-
-    def __init__(self, iteration_name='Debug'):
-        # Cumulative rotation angle for the x-axis
+    MAX_SCALE = None  # Will be dynamically set later, per instance
+
+    # The map size presets and the mesh version, from the geometry core
+    ITERATIONS = geometry.ITERATIONS
+    SUBDIVISION_VERSION = geometry.SUBDIVISION_VERSION
+
+    RENDER_MODES = ('wireframe', 'filled')
+    RENDER_BACKENDS = ('pygame', 'numpy')
+
+    def __init__(self, iteration_name='Debug', progress_callback=None, cancel_event=None, compact=None, seed=None,
+                 loaded_terrain=None):
+        """
+        Build or load the icosphere for a preset.
+
+        Args:
+            iteration_name (str): Key into ITERATIONS.
+            progress_callback (callable): Called with the fraction of the build done, from 0.0 to 1.0.
+            cancel_event (threading.Event): When set, the build stops by raising BuildCancelled.
+            compact (bool): Store the mesh as float32 and narrow integers. Defaults to COMPACT_MESH.
+            seed (int): Seed of the terrain. Defaults to TERRAIN_SEED.
+            loaded_terrain (terrain.Terrain): Terrain to use instead of generating it from the seed, such as the
+                terrain of a saved game.
+
+        Raises:
+            MeshBudgetExceeded: If the preset does not fit in MESH_MEMORY_BUDGET_MB and cannot be downgraded.
+        """
+        self._progress_callback = progress_callback
+        self._cancel_event = cancel_event
+        self.compact = COMPACT_MESH if compact is None else compact
+
+        # The preset that was asked for, which may be larger than the one that fits in the memory budget
+        self.requested_mapsize = iteration_name
+        iteration_name = geometry.fit_memory_budget(iteration_name, self.compact)
+
+        # Cumulative rotation angles around the polar (y) axis and the screen's x-axis (tilt). The mesh stays
+        # in model space and these angles are turned into one orientation matrix when a frame needs it.
+        self.cum_theta_y = 0.0
         self.cum_theta_x = 0.0
+        self._orientation = None
         self.need_redraw = True
 
-        # Initial rotation to align the poles
-        initial_theta_z = -np.pi / 6  # rotate by 30 degrees
-        self.vertices = self.rotate_around_z(self.vertices, initial_theta_z)
+        # Projected vertices and visibility masks for the current rotation and scale, shared by every consumer
+        # within a frame.
+        self._frame = None
+        self._frame_key = None
 
-        # Subdivision iterations
-        self._subdivide(Icosphere.ITERATIONS[iteration_name])
-        self.scale = MIN_SCALE
-        self._calculate_max_scale()
-        self._set_initial_zoom_level()
-        self._mapsize = iteration_name
+        # Draw coarser subdivision levels where the finest faces would be too small to see
+        self.lod_enabled = LOD_ENABLED
+
+        self._load_or_build_mesh(iteration_name)
+
+        # Elevation, land and biome of every vertex
+        self.terrain = loaded_terrain
+        if self.terrain is None:
+            self.terrain = terrain.load_or_generate(
+                geometry.mesh_cache_key(iteration_name, self.compact), self.vertices,
+                TERRAIN_SEED if seed is None else seed,
+                progress_callback=lambda fraction: self._report_progress(0.95 + 0.05 * fraction))
 
-    # Function to find the midpoints
-    @staticmethod
-    def _midpoint(p1, p2):
-        return (p1[0]+p2[0])/2, (p1[1]+p2[1])/2, (p1[2]+p2[2])/2
+        # Hexagon and pentagon tiles of the dual mesh, drawn instead of the triangles while show_tiles is set
+        self.tiles = TileLayer(self)
+        self.show_tiles = False
 
-    def _subdivide(self, iterations):
-        for _ in range(iterations):
-            initial_vertex_count = len(self.vertices)
+        # Shortest paths and distance fields between tiles, with movement costs from the terrain
+        self.pathfinder = Pathfinder(self)
 
-            new_faces = []
-            for face in self.faces:
-                a = self.vertices[face[0]]
-                b = self.vertices[face[1]]
-                c = self.vertices[face[2]]
+        # How faces are drawn, one of RENDER_MODES, and the base color of every face of each level for the filled
+        # mode, built the first time a level is drawn
+        self.render_mode = RENDER_MODE
+        self._level_colors = {}
 
-                # Calculate the midpoints
-                ab = self._midpoint(a, b)
-                bc = self._midpoint(b, c)
-                ca = self._midpoint(c, a)
+        # What draws the faces and lines: pygame.draw one shape at a time, or the NumPy rasterizer in batches
+        self.render_backend = RENDER_BACKEND_BY_PRESET.get(iteration_name, RENDER_BACKEND)
 
-                # Normalize the midpoints to push them out to the sphere's surface
-                ab = ab / np.linalg.norm(ab)
-                bc = bc / np.linalg.norm(bc)
-                ca = ca / np.linalg.norm(ca)
+        # (face, vertex) under the mouse and last clicked, highlighted when drawn
+        self.hovered = None
+        self.selected = None
 
-                # Add midpoints to vertices list
-                ab_idx = len(self.vertices)
-                bc_idx = len(self.vertices) + 1
-                ca_idx = len(self.vertices) + 2
+        self.scale = MIN_SCALE
+        self._calculate_max_scale()
+        self._set_initial_zoom_level()
+        self._mapsize = iteration_name
+        self._report_progress(1.0)
 
-                self.vertices = np.vstack([self.vertices, ab, bc, ca])
+    def _report_progress(self, fraction):
+        # Stop here if the build has been cancelled, otherwise tell the caller how far along it is
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            raise BuildCancelled()
+        if self._progress_callback is not None:
+            self._progress_callback(fraction)
 
-                # Create 4 new faces
-                new_faces.append([face[0], ab_idx, ca_idx])
-                new_faces.append([face[1], bc_idx, ab_idx])
-                new_faces.append([face[2], ca_idx, bc_idx])
-                new_faces.append([ab_idx, bc_idx, ca_idx])
+    @property
+    def memory_footprint(self):
+        """The memory taken by the mesh arrays and terrain, in bytes."""
+        return sum(array.nbytes for array in self._mesh_arrays.values()) + self.terrain.nbytes
 
-            # Normalize the original vertices to ensure they are on the sphere's surface
-            for i in range(initial_vertex_count):
-                self.vertices[i] = self.vertices[i] / np.linalg.norm(self.vertices[i])
+    def _load_or_build_mesh(self, iteration_name):
+        """
+        Load the mesh for a preset from the on-disk cache, building and caching it on the first use.
 
-            self.faces = np.array(new_faces)
+        Args:
+            iteration_name (str): Key into ITERATIONS.
+        """
+        iterations = Icosphere.ITERATIONS[iteration_name]
+        arrays = geometry.load_or_build_mesh(iteration_name, self.compact, self._report_progress)
+
+        self._mesh_arrays = arrays
+        self.vertices = arrays['vertices']
+        self.faces = arrays['faces']
+        self.level_faces = [arrays['faces_l{}'.format(level)] for level in range(iterations)] + [self.faces]
+        self.level_caps = [arrays['caps_l{}'.format(level)] for level in range(iterations + 1)]
+
+        # Neighbour lookups, each O(degree): see adjacency for the layout
+        self.vertex_adjacency = adjacency.Adjacency(arrays['vertex_vertices_indptr'], arrays['vertex_vertices_indices'])
+        self.vertex_face_adjacency = adjacency.Adjacency(arrays['vertex_faces_indptr'], arrays['vertex_faces_indices'])
+        self.face_adjacency = adjacency.Adjacency(arrays['face_faces_indptr'], arrays['face_faces_indices'])
 
     def project(self, vertex):
         """
@@ -146,77 +151,396 @@ class Icosphere:
         y = -vertex[1] * self.scale + OFFSET_Y  # We invert the y-axis because Pygame's y-axis points downward
         return int(x), int(y)
 
-    # Function to rotate the icosphere around the z-axis (z is depth, in-to and out-of the screen)
-    # This is only used to initially change the rotation of the planet so the poles are at the top and bottom.
-    @staticmethod
-    def rotate_around_z(verts: np.ndarray, theta_z: float) -> np.ndarray:
+    def project_vertices(self, verts, scale=None):
         """
-        Rotate the vertices around the z-axis.
+        Project an array of 3D vertices onto 2D at once, using the same orthographic projection as project.
 
         Args:
-            verts (list): List of vertices.
-            theta_z (float): Rotation angle.
+            verts (numpy.ndarray): (N, 3) array of vertices.
+            scale (float): Scale to project with. Defaults to the current scale.
 
         Returns:
-            numpy.ndarray: Rotated vertices.
+            numpy.ndarray: (N, 2) integer array of screen positions.
         """
-        # Z-axis rotation
-        rotation_matrix_z = np.array([
-            [np.cos(theta_z), -np.sin(theta_z), 0],
-            [np.sin(theta_z), np.cos(theta_z), 0],
-            [0, 0, 1]
-        ])
-
-        return np.dot(verts, rotation_matrix_z)
+        return geometry.project(verts, self.scale if scale is None else scale, (OFFSET_X, OFFSET_Y))
 
     # Function to free rotate the icosphere around its polar axis, and to tilt it back and forth
-    # We'll lock the tilting later to prevent anyone from flipping the planet upside down.
+    # Only the angles are accumulated here; vertices are transformed when a frame is built in _frame_buffers.
     def rotate_around_x_and_y(self, loc_theta_y, loc_theta_x):
         """
-        Rotate the vertices around both x and y-axis.
+        Rotate the icosphere around its polar axis and tilt it around the screen's x-axis.
 
         Args:
             loc_theta_y (float): Y-axis rotation angle.
             loc_theta_x (float): X-axis rotation angle.
         """
-        # Y-axis rotation
-        rotation_matrix_y = np.array([
-            [np.cos(loc_theta_y), 0, np.sin(loc_theta_y)],
-            [0, 1, 0],
-            [-np.sin(loc_theta_y), 0, np.cos(loc_theta_y)]
-        ])
-
-        # X-axis rotation
-        rotation_matrix_x = np.array([
-            [1, 0, 0],
-            [0, np.cos(loc_theta_x), -np.sin(loc_theta_x)],
-            [0, np.sin(loc_theta_x), np.cos(loc_theta_x)]
-        ])
+        self.cum_theta_y = (self.cum_theta_y + loc_theta_y) % (2 * np.pi)
+        self.cum_theta_x += loc_theta_x
+        self._orientation = None
 
-        self.vertices = np.dot(self.vertices, rotation_matrix_y)
-        self.vertices = np.dot(self.vertices, rotation_matrix_x)
+    @property
+    def orientation(self):
+        """The 3x3 matrix taking model space vertices (as row vectors) to view space."""
+        if self._orientation is None:
+            self._orientation = geometry.orientation(self.cum_theta_y, self.cum_theta_x)
+        return self._orientation
 
     def _calculate_max_scale(self):
-        # Find the maximum distance between two vertices of the same face
-        max_dist = 0
-        for face in self.faces:
-            a, b, c = self.vertices[face[0]], self.vertices[face[1]], self.vertices[face[2]]
-            max_dist = max(max_dist, np.linalg.norm(a - b), np.linalg.norm(b - c), np.linalg.norm(c - a))
-
-            # Set MAX_SCALE such that this distance fills the screen height
-            Icosphere.MAX_SCALE = SCREEN_HEIGHT / max_dist
+        # Set MAX_SCALE such that the longest edge fills the screen height
+        self.MAX_SCALE = SCREEN_HEIGHT / float(self._mesh_arrays['max_edge_length'][0])
 
     def _set_initial_zoom_level(self):
-        # Start completely zoomed out
-        self.scale = MIN_SCALE
+        # Start completely zoomed out and find the fewest 10% zoom steps that leave at most 300 faces on screen,
+        # stopping once we reach max. Zooming in only ever removes faces from the screen, so the number of steps
+        # can be found by bisection instead of recounting after every step. Each count comes from the
+        # hierarchical culling pass at the finest level, so it only touches the part of the mesh near the screen.
+        lod_enabled = self.lod_enabled
+        self.lod_enabled = False
+
+        def faces_on_screen(steps):
+            self.scale = MIN_SCALE * 1.1 ** steps
+            return self.drawn_faces_count
+
+        low = 0
+        high = max(int(np.ceil(np.log(self.MAX_SCALE / MIN_SCALE) / np.log(1.1))), 1)
+        while low < high:
+            steps = (low + high) // 2
+            if faces_on_screen(steps) > 300:
+                low = steps + 1
+            else:
+                high = steps
+
+        self.scale = MIN_SCALE * 1.1 ** low
+        self.lod_enabled = lod_enabled
+
+    def _fine_enough(self, level, nodes):
+        """
+        Check which faces of a level are already small enough on screen that refining them adds no detail.
+
+        The size is the cap's diameter in pixels, shrunk towards the limb where faces are foreshortened.
+
+        Args:
+            level (int): Subdivision level of the faces.
+            nodes (numpy.ndarray): Face indices within that level.
+
+        Returns:
+            numpy.ndarray: Boolean mask over nodes.
+        """
+        caps = self.level_caps[level][nodes]
+        facing = np.clip(np.dot(caps[:, :3], self.orientation[:, 2]), 0.1, 1.0)
+        return 2 * caps[:, 3] * self.scale * np.sqrt(facing) < LOD_TRIANGLE_SIZE
+
+    def _cull_faces(self):
+        """
+        Find the faces to draw by descending the face hierarchy from the 20 base faces.
+
+        A node whose cap is behind the sphere or off the screen is dropped with all of its descendants, and a
+        node whose cap is entirely in front and on screen is drawn without any further tests. Only the nodes in
+        between are split and tested again, so the cost follows the number of visible faces. With level of
+        detail enabled, descent stops at the first level whose faces are small enough on screen, otherwise it
+        goes down to the finest faces.
+
+        Returns:
+            list: (level, inside, candidates) tuples of face indices within each level. Faces in inside are
+            known to be drawn; candidates still need the exact per-face test.
+        """
+        orientation = self.orientation
+        depth = len(self.level_faces) - 1
+        nodes = np.arange(len(self.level_faces[0]))
+        inside = np.empty(0, dtype=np.int64)
+        drawn = []
+
+        for level in range(depth + 1):
+            caps = self.level_caps[level][nodes]
+            centers = np.dot(caps[:, :3], orientation)
+            radii = caps[:, 3]
+
+            x = centers[:, 0] * self.scale + OFFSET_X
+            y = -centers[:, 1] * self.scale + OFFSET_Y
+            extent = radii * self.scale
+
+            # Projected positions are truncated to whole pixels, so anything within a pixel of the screen bounds
+            # may still land on them
+            overlaps = ((centers[:, 2] + radii > 0) &
+                        (x + extent > -1) & (x - extent < SCREEN_WIDTH + 1) &
+                        (y + extent > -1) & (y - extent < SCREEN_HEIGHT + 1))
+            contained = ((centers[:, 2] - radii > 0) &
+                         (x - extent >= 0) & (x + extent <= SCREEN_WIDTH) &
+                         (y - extent >= 0) & (y + extent <= SCREEN_HEIGHT))
+
+            inside = np.concatenate([inside, nodes[contained]])
+            nodes = nodes[overlaps & ~contained]
+
+            if level == depth:
+                drawn.append((level, inside, nodes))
+            elif self.lod_enabled:
+                inside_done = self._fine_enough(level, inside)
+                nodes_done = self._fine_enough(level, nodes)
+                drawn.append((level, inside[inside_done], nodes[nodes_done]))
+                inside = inside[~inside_done]
+                nodes = nodes[~nodes_done]
+            else:
+                # Every finest face below a contained node is drawn
+                span = 4 ** (depth - level)
+                starts = inside * span
+                drawn.append((depth, (starts[:, np.newaxis] + np.arange(span)).ravel(), np.empty(0, dtype=np.int64)))
+                inside = np.empty(0, dtype=np.int64)
+
+            if level < depth:
+                inside = (inside[:, np.newaxis] * 4 + np.arange(4)).ravel()
+                nodes = (nodes[:, np.newaxis] * 4 + np.arange(4)).ravel()
+
+        return drawn
+
+    def _frame_buffers(self):
+        """
+        Get the visible faces and the screen positions of their vertices for the current view, recomputing them
+        only when the rotation, scale or level of detail setting has changed since they were last built.
+
+        Returns:
+            dict: 'visible_faces', the (K, 3) vertex indices of the faces that get drawn, with 'face_levels' and
+            'face_ids' locating each of them in level_faces; 'vertex_ids', the sorted indices of every vertex
+            that can be on screen; 'projected' and 'on_screen', their screen positions and whether each is in
+            front and within the screen bounds; and the 'drawn_vertices' and 'drawn_faces' counts.
+        """
+        key = (self.cum_theta_y, self.cum_theta_x, self.scale, self.lod_enabled)
+        if self._frame is not None and self._frame_key == key:
+            return self._frame
+
+        faces, levels, ids, known = [], [], [], []
+        for level, inside, candidates in self._cull_faces():
+            for group, is_inside in ((inside, True), (candidates, False)):
+                faces.append(self.level_faces[level][group])
+                levels.append(np.full(len(group), level))
+                ids.append(group)
+                known.append(np.full(len(group), is_inside))
+        faces = np.concatenate(faces)
+        levels = np.concatenate(levels)
+        ids = np.concatenate(ids)
+        known = np.concatenate(known)
+
+        # Project only the vertices of faces that survived the hierarchical culling
+        vertex_ids, local_faces = np.unique(faces, return_inverse=True)
+        local_faces = local_faces.reshape(-1, 3)
+        vertices = np.dot(self.vertices[vertex_ids], self.orientation)
+        projected = self.project_vertices(vertices)
+
+        in_front = vertices[:, 2] > 0
+        x_on_screen = (projected[:, 0] >= 0) & (projected[:, 0] <= SCREEN_WIDTH)
+        y_on_screen = (projected[:, 1] >= 0) & (projected[:, 1] <= SCREEN_HEIGHT)
+        on_screen = in_front & x_on_screen & y_on_screen
+
+        # Keep candidate faces with all vertices in front of the centerpoint of the sphere, and with any of the
+        # vertices within the screen bounds.
+        visible = known | (in_front[local_faces].all(axis=1) & x_on_screen[local_faces].any(axis=1) &
+                           y_on_screen[local_faces].any(axis=1))
+
+        self._frame = {
+            'visible_faces': faces[visible],
+            'face_levels': levels[visible],
+            'face_ids': ids[visible],
+            'vertex_ids': vertex_ids,
+            'projected': projected,
+            'on_screen': on_screen,
+            'drawn_vertices': int(np.count_nonzero(on_screen)),
+            # Faces with all 3 vertices on the screen
+            'drawn_faces': int(np.count_nonzero(on_screen[local_faces[visible]].all(axis=1))),
+        }
+        self._frame_key = key
+        return self._frame
+
+    def screen_positions(self, indices):
+        """
+        Get the screen positions of vertices for the current view, reading them from this frame's projection
+        buffer when they are in it.
+
+        Args:
+            indices (numpy.ndarray): Vertex indices.
+
+        Returns:
+            numpy.ndarray: (N, 2) integer array of screen positions.
+        """
+        indices = np.asarray(indices)
+        frame = self._frame_buffers()
+        vertex_ids = frame['vertex_ids']
+        local = np.minimum(np.searchsorted(vertex_ids, indices), max(len(vertex_ids) - 1, 0))
+        if len(vertex_ids) and np.array_equal(vertex_ids[local], indices):
+            return frame['projected'][local]
+        return self.project_vertices(np.dot(self.vertices[indices], self.orientation))
+
+    def unproject(self, screen_points):
+        """
+        Find the points on the sphere under screen positions, for the current orientation and scale.
+
+        Args:
+            screen_points (numpy.ndarray): (N, 2) array of screen positions.
+
+        Returns:
+            tuple: (points, hit) where points is an (N, 3) array of model space points on the unit sphere, and
+            hit says which screen positions are over the sphere at all. Points that miss are left at the nearest
+            point of the sphere's outline.
+        """
+        screen_points = np.asarray(screen_points, dtype=np.float64).reshape(-1, 2)
+        view = np.empty((len(screen_points), 3))
+        view[:, 0] = (screen_points[:, 0] - OFFSET_X) / self.scale
+        view[:, 1] = -(screen_points[:, 1] - OFFSET_Y) / self.scale  # Pygame's y-axis points downward
 
-        while self.drawn_faces_count > 300:
-            # Increase zoom level (decrease the number of visible faces)
-            self.scale *= 1.1  # Increase scale by 10%
+        # The front half of the sphere faces the viewer, at positive z
+        radius_squared = np.einsum('ij,ij->i', view[:, :2], view[:, :2])
+        hit = radius_squared <= 1.0
+        view[~hit, :2] /= np.sqrt(radius_squared[~hit])[:, np.newaxis]
+        view[:, 2] = np.sqrt(np.clip(1.0 - radius_squared, 0.0, 1.0))
 
-            # Break out if we reach max, to avoid infinite loops
-            if self.scale >= Icosphere.MAX_SCALE:
-                break
+        # The orientation is a rotation, so its transpose takes view space back to model space
+        return np.dot(view, self.orientation.T), hit
+
+    def locate(self, lat, lon):
+        """
+        Find the faces containing and the vertices nearest to many geographic coordinates at once, e.g. to place
+        labels, units or cities.
+
+        Args:
+            lat (numpy.ndarray): Latitudes in degrees, north positive.
+            lon (numpy.ndarray): Longitudes in degrees, east positive, broadcast against lat.
+
+        Returns:
+            tuple: (faces, vertices), two (N,) arrays indexing faces and vertices. The vertex is the tile each
+            coordinate lies on.
+        """
+        return self._locate_points(geometry.latlon_to_points(lat, lon))
+
+    def latlon(self, vertices=None):
+        """
+        Get the geographic coordinates of vertices.
+
+        Args:
+            vertices (numpy.ndarray): Vertex indices. Defaults to every vertex.
+
+        Returns:
+            tuple: (lat, lon), two float64 arrays in degrees.
+        """
+        points = self.vertices if vertices is None else np.asarray(self.vertices)[np.asarray(vertices, dtype=np.int64)]
+        return geometry.points_to_latlon(points)
+
+    def _locate_points(self, points):
+        # Plain views of the mesh arrays, which skip numpy.memmap's per-lookup overhead
+        vertices = np.asarray(self.vertices)
+        faces = geometry.locate_faces(points, vertices, self.level_faces)
+        return faces, geometry.nearest_vertices(points, vertices, np.asarray(self.faces), faces, self.vertex_adjacency)
+
+    def pick_faces(self, screen_points):
+        """
+        Find the faces and vertices under several screen positions at once.
+
+        Args:
+            screen_points (numpy.ndarray): (N, 2) array of screen positions.
+
+        Returns:
+            tuple: (faces, vertices), two (N,) arrays indexing faces and vertices, with -1 where a position is not
+            over the sphere. The vertex is the one nearest to the position, i.e. the tile under it.
+        """
+        points, hit = self.unproject(screen_points)
+        faces = np.full(len(points), -1, dtype=np.int64)
+        vertices = np.full(len(points), -1, dtype=np.int64)
+        if not hit.any():
+            return faces, vertices
+
+        faces[hit], vertices[hit] = self._locate_points(points[hit])
+        return faces, vertices
+
+    def pick(self, screen_pos):
+        """
+        Find the face and vertex under a screen position.
+
+        Args:
+            screen_pos (tuple): The (x, y) screen position, e.g. of the mouse.
+
+        Returns:
+            tuple: (face, vertex) indices, or None if the position is not over the sphere.
+        """
+        faces, vertices = self.pick_faces([screen_pos])
+        if faces[0] < 0:
+            return None
+        return int(faces[0]), int(vertices[0])
+
+    def hover(self, screen_pos):
+        # Highlight what is under the mouse, redrawing only when that changes
+        picked = self.pick(screen_pos)
+        if picked != self.hovered:
+            self.hovered = picked
+            self.need_redraw = True
+
+    def select(self, screen_pos):
+        picked = self.pick(screen_pos)
+        if picked != self.selected:
+            self.selected = picked
+            self.need_redraw = True
+
+    def _draw_highlight(self, screen, picked, color):
+        # Outline the picked face, or the picked vertex's tile in the tile view, if it faces the viewer
+        face, vertex = picked
+        if self.show_tiles:
+            outline = self.tiles.polygon(vertex)
+        else:
+            outline = self.vertices[self.faces[face].astype(np.int64)].astype(np.float64)
+
+        view = np.dot(outline, self.orientation)
+        if (view[:, 2] > 0).all():
+            pygame.draw.lines(screen, color, True, self.project_vertices(view).tolist(), 2)
+
+    def face_colors(self, level):
+        """
+        Get the base color of every face of a level: the average terrain color of its corners.
+
+        Args:
+            level (int): Subdivision level, indexing level_faces.
+
+        Returns:
+            numpy.ndarray: (F, 3) uint8 array of RGB colors. It is kept and reused, so changes to it show up the
+            next time the globe is drawn.
+        """
+        if level not in self._level_colors:
+            corner_colors = terrain.BIOME_COLORS[self.terrain.biome[self.level_faces[level]]]
+            self._level_colors[level] = corner_colors.mean(axis=1, dtype=np.float32).astype(np.uint8)
+        return self._level_colors[level]
+
+    def shaded_colors(self, frame):
+        """
+        Get the Lambert shaded color of every face drawn this frame.
+
+        Args:
+            frame (dict): The frame buffers, from _frame_buffers.
+
+        Returns:
+            numpy.ndarray: (K, 3) uint8 array of RGB colors, one per visible face.
+        """
+        levels, ids = frame['face_levels'], frame['face_ids']
+        colors = np.empty((len(ids), 3), dtype=np.float32)
+        normals = np.empty((len(ids), 3))
+        for level in np.unique(levels).tolist():
+            at_level = levels == level
+            colors[at_level] = self.face_colors(level)[ids[at_level]]
+            # The bounding cap centers are the face normals, pointing out of the sphere
+            normals[at_level] = self.level_caps[level][ids[at_level], :3]
+
+        light = np.asarray(LIGHT_DIRECTION, dtype=np.float64)
+        light /= np.linalg.norm(light)
+        diffuse = np.maximum(np.dot(np.dot(normals, self.orientation), light), 0.0)
+        colors *= (AMBIENT_LIGHT + (1.0 - AMBIENT_LIGHT) * diffuse)[:, np.newaxis].astype(np.float32)
+        return colors.astype(np.uint8)
+
+    def uses_rasterizer(self, screen):
+        """Whether this frame is drawn with the NumPy rasterizer, which needs a 16 or 32 bit surface."""
+        return self.render_backend == 'numpy' and rasterizer.supports(screen)
+
+    def _draw_filled(self, screen, frame):
+        # One filled polygon per visible face, in its shaded terrain color
+        polygons = frame['projected'][np.searchsorted(frame['vertex_ids'], frame['visible_faces'])]
+        if self.uses_rasterizer(screen):
+            rasterizer.fill_triangles(screen, polygons, self.shaded_colors(frame))
+            return
+        for polygon, color in zip(polygons.tolist(), self.shaded_colors(frame).tolist()):
+            pygame.draw.polygon(screen, color, polygon)
 
     # Function to draw the icosphere
     def draw(self, screen):
@@ -226,17 +550,33 @@ class Icosphere:
         Args:
             screen (pygame.Surface): The surface on which the icosphere should be drawn.
         """
-        for face in self.faces:
-            # Check if all vertices of the face are in front of the centerpoint of the sphere.
-            if all(self.vertices[face[i]][2] > 0 for i in range(3)):
-                v1 = self.project(self.vertices[face[0]])
-                v2 = self.project(self.vertices[face[1]])
-                v3 = self.project(self.vertices[face[2]])
-
-                # Check if any of the vertices are within the screen bounds
-                if (any(0 <= vertex[0] <= SCREEN_WIDTH for vertex in [v1, v2, v3]) and
-                        any(0 <= vertex[1] <= SCREEN_HEIGHT for vertex in [v1, v2, v3])):
-                    pygame.draw.polygon(screen, (255, 255, 255), [v1, v2, v3], 1)
+        with frame_profiler.scope('globe.frame'):
+            frame = self._frame_buffers()
+        frame_profiler.count('faces_drawn', frame['drawn_faces'])
+        if len(frame['visible_faces']) == 0:
+            return
+
+        if self.render_mode == 'filled':
+            with frame_profiler.scope('globe.faces'):
+                self._draw_filled(screen, frame)
+
+        with frame_profiler.scope('globe.lines'):
+            if self.show_tiles:
+                self.tiles.draw(screen)
+            elif self.render_mode == 'wireframe':
+                # Draw every edge of the visible faces once, even where two visible faces share it
+                edges, _ = geometry.edge_table(frame['visible_faces'])
+                segments = frame['projected'][np.searchsorted(frame['vertex_ids'], edges)]
+                if self.uses_rasterizer(screen):
+                    rasterizer.draw_lines(screen, segments[:, 0], segments[:, 1], (255, 255, 255))
+                else:
+                    for start, end in segments.tolist():
+                        pygame.draw.line(screen, (255, 255, 255), start, end)
+
+        if self.selected is not None:
+            self._draw_highlight(screen, self.selected, (255, 200, 0))
+        if self.hovered is not None and self.hovered != self.selected:
+            self._draw_highlight(screen, self.hovered, (0, 200, 255))
 
     def handle_mouse_motion(self, dx, dy, rotation_speed):
         """
@@ -252,18 +592,28 @@ class Icosphere:
         theta_y = (-rotation_speed * dx) / zoom_scaling
         theta_x = (-rotation_speed * dy) / zoom_scaling
 
-        # Check if the cumulative rotation around x-axis is within the bounds of -80 and 80 degrees
-        new_cum_theta_x = self.cum_theta_x + theta_x
-        if -np.pi / 180 * 80 <= new_cum_theta_x <= np.pi / 180 * 80:
-            self.cum_theta_x = new_cum_theta_x
-            self.rotate_around_x_and_y(theta_y, theta_x)
-        else:
-            self.rotate_around_x_and_y(theta_y, 0)
+        # Clamp the cumulative rotation around x-axis to the bounds of -80 and 80 degrees
+        max_tilt = np.pi / 180 * 80
+        new_cum_theta_x = np.clip(self.cum_theta_x + theta_x, -max_tilt, max_tilt)
+        self.rotate_around_x_and_y(theta_y, new_cum_theta_x - self.cum_theta_x)
 
         self.need_redraw = True  # Indicate that a redraw of the screen is needed, as it has been rotated.
 
+    def cycle_render_mode(self):
+        self.render_mode = self.RENDER_MODES[(self.RENDER_MODES.index(self.render_mode) + 1) % len(self.RENDER_MODES)]
+        self.need_redraw = True
+
+    def cycle_render_backend(self):
+        self.render_backend = self.RENDER_BACKENDS[
+            (self.RENDER_BACKENDS.index(self.render_backend) + 1) % len(self.RENDER_BACKENDS)]
+        self.need_redraw = True
+
+    def toggle_tiles(self):
+        self.show_tiles = not self.show_tiles
+        self.need_redraw = True
+
     def zoom_in(self):
-        if self.scale * ZOOM_FACTOR <= Icosphere.MAX_SCALE:
+        if self.scale * ZOOM_FACTOR <= self.MAX_SCALE:
             self.scale *= ZOOM_FACTOR
             self.need_redraw = True
 
@@ -290,13 +640,7 @@ class Icosphere:
     @property
     def drawn_vertices_count(self):
         """Returns the count of vertices being rendered on screen."""
-        count = 0
-        for vertex in self.vertices:
-            if vertex[2] > 0:
-                x, y = self.project(vertex)
-                if 0 <= x <= SCREEN_WIDTH and 0 <= y <= SCREEN_HEIGHT:
-                    count += 1
-        return count
+        return self._frame_buffers()['drawn_vertices']
 
     # Property to get the count of faces
     @property
@@ -306,15 +650,7 @@ class Icosphere:
     @property
     def drawn_faces_count(self):
         """Returns the count of faces being rendered on screen."""
-        count = 0
-        for face in self.faces:
-            vertices_on_screen = [self.vertices[face[i]] for i in range(3) if
-                                  self.vertices[face[i]][2] > 0 and 0 <= self.project(self.vertices[face[i]])[
-                                      0] <= SCREEN_WIDTH and 0 <= self.project(self.vertices[face[i]])[
-                                      1] <= SCREEN_HEIGHT]
-            if len(vertices_on_screen) == 3:  # all 3 vertices of the face are on the screen
-                count += 1
-        return count
+        return self._frame_buffers()['drawn_faces']
 
     # Property to get the current zoom level
     @property
@@ -1,24 +1,22 @@
 import pygame
-from config import SCREEN_WIDTH, SCREEN_HEIGHT
-from ui_classes import Button, DebugMenu, GameMenu
+from config import SCREEN_WIDTH, SCREEN_HEIGHT, MAX_FPS, IDLE_WAIT_MS, SAVE_DIR, PROFILER_TRACE_FILE
+from globe_builder import GlobeBuilder
+import savegame
+from ui_classes import Button, DebugMenu, GameMenu, ProgressBar
+import fonts
+from fonts import render_text
+from profiler import frame_profiler
 
 
 # Function to draw labels attached to specified vertices
-def draw_labels(local_screen, local_vertices, globe):
-    # Define the indices for the North and South Pole vertices
-    north_pole_index = 1
-    south_pole_index = 2
+def draw_labels(local_screen, globe):
+    # Find the tiles at the North and South Pole, and look them up in the globe's projected vertices for this frame
+    _, pole_indices = globe.locate([90, -90], 0)
+    north_pole_2d, south_pole_2d = globe.screen_positions(pole_indices).tolist()
 
-    # Project the poles onto the screen
-    north_pole_2d = globe.project(local_vertices[north_pole_index])
-    south_pole_2d = globe.project(local_vertices[south_pole_index])
-
-    # Fonts for specific labels
-    pole_font = pygame.font.Font(None, 36)
-
-    # Render the labels
-    north_label = pole_font.render("N", True, (255, 64, 64))
-    south_label = pole_font.render("S", True, (255, 64, 64))
+    # Render the labels in pygame's default font, reusing them from the text cache after the first frame
+    north_label = render_text(None, 36, "N", (255, 64, 64))
+    south_label = render_text(None, 36, "S", (255, 64, 64))
 
     # Label offset to keep the label a bit away from the vertex
     offset = 10
@@ -36,9 +34,17 @@ class GameManager:
         # Set up the display & create an instance of the Icosphere.
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption('Icosphere Map')
+        self.clock = pygame.time.Clock()
 
         self.globe = None
 
+        # Globes are generated on a worker thread, with a progress bar shown until they are ready
+        self.globe_builder = GlobeBuilder()
+        self.progress_bar = ProgressBar(SCREEN_WIDTH, SCREEN_HEIGHT)
+
+        # Offscreen surface holding the last rendered globe, only redrawn when the globe's view changes
+        self.globe_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+
         # Variables for user-interactions
         self.dragging = False
         self.prev_mouse_x, self.prev_mouse_y = 0, 0
@@ -57,82 +63,173 @@ class GameManager:
         self.globe = globe
         self.globe.need_redraw = True
 
+    def start_new_game(self, iteration_name):
+        # Any globe still being generated for an earlier request is cancelled
+        self.globe_builder.start(iteration_name)
+
+    def save_game(self):
+        # Saves are small and quick to write, so this happens on the main thread. A failed write, such as a full disk
+        # or no permission, or a damaged layer in the save the globe was loaded from, is reported like a failed build.
+        if self.globe:
+            try:
+                savegame.save(savegame.save_path('quicksave'), self.globe)
+            except (OSError, savegame.SaveFormatError) as e:
+                self.globe_builder.error = 'Saving failed: {}'.format(e)
+
+    def load_game(self):
+        # Load the most recent save in the background, like a new game
+        path = savegame.latest_save()
+        if path is None:
+            print("No saved games in {}".format(SAVE_DIR))
+        else:
+            self.globe_builder.start_load(path)
+
+    def wait_for_events(self):
+        """
+        Get the pending events. When there are none and the globe does not need redrawing, sleep until an event
+        arrives or IDLE_WAIT_MS passes, so an idle map does not spin the CPU.
+
+        Returns:
+            list: The events to handle this frame.
+        """
+        events = pygame.event.get()
+        if events or (self.globe and self.globe.need_redraw) or self.globe_builder.busy:
+            return events
+
+        event = pygame.event.wait(IDLE_WAIT_MS)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+
+    def draw_globe(self):
+        # Re-render the globe into its offscreen surface only when it has been rotated or zoomed
+        if self.globe.need_redraw:
+            self.globe_surface.fill((64, 64, 64))  # Fill the surface with a dark gray background
+            with frame_profiler.scope('globe'):
+                self.globe.draw(self.globe_surface)  # Call the function to draw the icomap
+            with frame_profiler.scope('labels'):
+                draw_labels(self.globe_surface, self.globe)  # Call the function to draw the labels
+            self.globe.need_redraw = False  # Reset the redraw flag after a redraw.
+
+        self.screen.blit(self.globe_surface, (0, 0))
+
     def main(self):
         # Main loop
         running = True
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-
-                # Check for QuitDialog's decision
-                quit_decision = self.game_menu.quit_dialog.handle_quit_dialog_event(event)
-                if quit_decision == "QUIT":
-                    running = False
-
-                # Mouse event handling
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    # Button interactions
-                    if self.game_button.rect.collidepoint(event.pos):
-                        self.game_button.handle_button_event(event)
-                    elif self.debug_button.rect.collidepoint(event.pos):
-                        self.debug_button.handle_button_event(event)
-                    # Game menu interactions
-                    elif self.game_menu.quit_dialog.rect.collidepoint(event.pos):
-                        self.game_menu.quit_dialog.handle_quit_dialog_event(event)
-                    elif self.game_menu.rect.collidepoint(event.pos):
-                        self.game_menu.handle_game_menu_event(event)
-                    # Debug menu interactions
-                    elif self.debug_menu.is_visible:
-                        self.debug_menu.handle_debug_menu_event(event)
-                    elif self.debug_menu.rect.collidepoint(event.pos):
-                        self.dragging_inside_debug_menu = True
-                # if event.type == pygame.MOUSEBUTTONDOWN:
-                    # Globe interactions
-                    elif self.globe:
-                        if event.button == 4:  # Mouse wheel up
-                            self.globe.zoom_in()
-                        elif event.button == 5:  # Mouse wheel down
-                            self.globe.zoom_out()
-                    else:
-                        # If not clicking the buttons, start dragging.
-                        self.dragging = True
-                        self.prev_mouse_x, self.prev_mouse_y = pygame.mouse.get_pos()
-
-                # Mouse button release handling
-                if event.type == pygame.MOUSEBUTTONUP:
-                    self.dragging = False
-                    self.dragging_inside_debug_menu = False
-
-                # Moues motion handling
-                if event.type == pygame.MOUSEMOTION and self.dragging:
-                    mx, my = pygame.mouse.get_pos()
-                    dx = mx - self.prev_mouse_x
-                    dy = my - self.prev_mouse_y
-
-                    if self.dragging and not self.dragging_inside_debug_menu:
-                        self.globe.handle_mouse_motion(dx, dy, self.rotation_speed)
-
-                    self.prev_mouse_x, self.prev_mouse_y = mx, my
-
-            self.screen.fill((64, 64, 64))  # Fill the screen with a dark gray background
+            events = self.wait_for_events()
+
+            # Frames are timed from here, leaving out the time spent waiting for events while idle
+            frame_profiler.begin_frame()
+            with frame_profiler.scope('events'):
+                for event in events:
+                    if event.type == pygame.QUIT:
+                        running = False
+
+                    # Check for QuitDialog's decision
+                    quit_decision = self.game_menu.quit_dialog.handle_quit_dialog_event(event)
+                    if quit_decision == "QUIT":
+                        running = False
+
+                    # Mouse event handling
+                    if event.type == pygame.MOUSEBUTTONDOWN:
+                        # Button interactions
+                        if self.game_button.rect.collidepoint(event.pos):
+                            self.game_button.handle_button_event(event)
+                        elif self.debug_button.rect.collidepoint(event.pos):
+                            self.debug_button.handle_button_event(event)
+                        # Game menu interactions
+                        elif self.game_menu.quit_dialog.rect.collidepoint(event.pos):
+                            self.game_menu.quit_dialog.handle_quit_dialog_event(event)
+                        elif self.game_menu.rect.collidepoint(event.pos):
+                            self.game_menu.handle_game_menu_event(event)
+                        # Debug menu interactions
+                        elif self.debug_menu.is_visible:
+                            self.debug_menu.handle_debug_menu_event(event)
+                        elif self.debug_menu.rect.collidepoint(event.pos):
+                            self.dragging_inside_debug_menu = True
+                    # if event.type == pygame.MOUSEBUTTONDOWN:
+                        # Globe interactions
+                        elif self.globe:
+                            if event.button == 4:  # Mouse wheel up
+                                self.globe.zoom_in()
+                            elif event.button == 5:  # Mouse wheel down
+                                self.globe.zoom_out()
+                            elif event.button == 1:  # Select the face under the cursor
+                                self.globe.select(event.pos)
+                        else:
+                            # If not clicking the buttons, start dragging.
+                            self.dragging = True
+                            self.prev_mouse_x, self.prev_mouse_y = pygame.mouse.get_pos()
+
+                    # Keyboard shortcuts
+                    if event.type == pygame.KEYDOWN and self.globe:
+                        if event.key == pygame.K_t:  # Switch between the triangle and tile views
+                            self.globe.toggle_tiles()
+                        elif event.key == pygame.K_f:  # Switch between wireframe and filled faces
+                            self.globe.cycle_render_mode()
+                        elif event.key == pygame.K_b:  # Switch between the pygame.draw and NumPy render backends
+                            self.globe.cycle_render_backend()
+
+                    # Profiling works with or without a globe
+                    if event.type == pygame.KEYDOWN:
+                        if event.key == pygame.K_p:  # Start or stop recording frame times
+                            frame_profiler.set_enabled(not frame_profiler.enabled)
+                        elif event.key == pygame.K_o:  # Write the recorded frames to a trace file
+                            frames = frame_profiler.dump(PROFILER_TRACE_FILE)
+                            print("Wrote {} frames to {}".format(frames, PROFILER_TRACE_FILE))
+
+                    # Mouse button release handling
+                    if event.type == pygame.MOUSEBUTTONUP:
+                        self.dragging = False
+                        self.dragging_inside_debug_menu = False
+
+                    # Highlight the face under the cursor while it is not dragging the globe
+                    if event.type == pygame.MOUSEMOTION and self.globe and not self.dragging:
+                        self.globe.hover(event.pos)
+
+                    # Moues motion handling
+                    if event.type == pygame.MOUSEMOTION and self.dragging:
+                        mx, my = pygame.mouse.get_pos()
+                        dx = mx - self.prev_mouse_x
+                        dy = my - self.prev_mouse_y
+
+                        if self.dragging and not self.dragging_inside_debug_menu:
+                            self.globe.handle_mouse_motion(dx, dy, self.rotation_speed)
+
+                        self.prev_mouse_x, self.prev_mouse_y = mx, my
+
+            # Swap in a newly generated globe once it is ready
+            new_globe = self.globe_builder.poll()
+            if new_globe:
+                self.set_globe(new_globe)
+            elif self.globe_builder.error:
+                print(self.globe_builder.error)
+                self.globe_builder.error = None
 
             # Draw the globe-related items (if the globe exists)
             if self.globe:
-                if self.globe.need_redraw:
-                    self.globe.draw(self.screen)  # Call the function to draw the icomap
-                    draw_labels(self.screen, self.globe.vertices, self.globe)  # Call the function to draw the labels
-                    self.globe.need_redraw = True  # The should be False to reset the redraw flag after a redraw.
+                self.draw_globe()
+            else:
+                self.screen.fill((64, 64, 64))  # Fill the screen with a dark gray background
 
             # Draw the UI-related elements that should always be there.
-            self.debug_button.draw(self.screen)
-            self.debug_menu.draw(self.screen, self.globe)
-            self.game_button.draw(self.screen)
-            self.game_menu.draw(self.screen)
-            self.game_menu.quit_dialog.draw(self.screen)
-
-            pygame.display.flip()  # Update the full display Surface to the screen
-
+            with frame_profiler.scope('ui'):
+                self.debug_button.draw(self.screen)
+                self.debug_menu.draw(self.screen, self.globe)
+                self.game_button.draw(self.screen)
+                self.game_menu.draw(self.screen)
+                self.game_menu.quit_dialog.draw(self.screen)
+                if self.globe_builder.busy:
+                    self.progress_bar.draw(self.screen, self.globe_builder.status, self.globe_builder.progress)
+
+            with frame_profiler.scope('flip'):
+                pygame.display.flip()  # Update the full display Surface to the screen
+            frame_profiler.end_frame()
+            self.clock.tick(MAX_FPS)  # Limit the frame rate
+
+        self.globe_builder.shutdown()
+        fonts.clear()
         pygame.quit()
 
 
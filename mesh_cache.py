@@ -0,0 +1,78 @@
+import os
+import numpy as np
+from config import MESH_CACHE_DIR
+
+
+def cache_path(key):
+    """
+    Get the directory holding the cached arrays for a key.
+
+    Args:
+        key (str): The cache key, e.g. "tiny-v1".
+
+    Returns:
+        str: Path of the cache directory for that key.
+    """
+    return os.path.join(MESH_CACHE_DIR, key)
+
+
+def has_arrays(key, names):
+    """
+    Check whether a set of arrays is in the cache, without loading them.
+
+    Args:
+        key (str): The cache key the arrays were saved under.
+        names (list): Names of the arrays.
+
+    Returns:
+        bool: True if every array has a file in the cache.
+    """
+    return all(os.path.isfile(os.path.join(cache_path(key), name + '.npy')) for name in names)
+
+
+def load_arrays(key, names, mmap_mode='r'):
+    """
+    Load a set of cached arrays, memory-mapped by default so processes can share the pages.
+
+    Args:
+        key (str): The cache key the arrays were saved under.
+        names (list): Names of the arrays to load.
+        mmap_mode (str): Passed on to numpy.load. Use None to read the arrays fully into memory.
+
+    Returns:
+        dict: The arrays by name, or None if any of them is missing or unreadable.
+    """
+    arrays = {}
+    for name in names:
+        path = os.path.join(cache_path(key), name + '.npy')
+        try:
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        except (OSError, ValueError):
+            return None
+    return arrays
+
+
+def save_arrays(key, arrays):
+    """
+    Save arrays to the cache. Each array is written to a temporary file and moved into place, so a reader
+    never sees a partially written file.
+
+    Args:
+        key (str): The cache key to save the arrays under.
+        arrays (dict): The arrays by name.
+
+    Returns:
+        bool: True if every array was written, False if the cache directory is not writable.
+    """
+    directory = cache_path(key)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for name, array in arrays.items():
+            path = os.path.join(directory, name + '.npy')
+            temp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(temp_path, path)
+    except OSError:
+        return False
+    return True
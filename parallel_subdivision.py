@@ -0,0 +1,233 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import geometry
+
+# Parallel subdivision of the icosahedron, one process per base face.
+#
+# Every base face is subdivided on its own, so the only coordination needed is that the two faces either side of
+# a base edge give the vertices along it the same index. Vertices are numbered level by level: the vertices of
+# level l take indices 0 to 10 * 4^l + 1, and the midpoint of level l's edge j becomes vertex 10 * 4^l + 2 + j
+# of level l + 1. Edge numbers are worked out from the edge's position rather than from a shared table:
+#
+#   - the 2^l segments of base edge e are numbered e * 2^l + k, with k counted from the base edge's lower
+#     vertex index, so both neighbouring faces agree on them;
+#   - the edges inside base face b follow, in a block of (3 * 4^l - 3 * 2^l) / 2 per base face.
+#
+# Each process also splits faces in the same order as geometry.subdivide_once, so face f of the result still
+# has its children at rows 4f to 4f + 3. Only the order of the vertices within a level differs from the serial
+# build, and once every face is done the vertices are renumbered into the serial build's order (see
+# _serial_order), so both builds give the same mesh whatever the number of processes.
+
+
+def _vertex_count(level):
+    return 10 * 4 ** level + 2
+
+
+def _interior_edge_count(level):
+    # Edges of a base face subdivided l times, minus the 3 * 2^l segments along its sides
+    segments = 2 ** level
+    return (3 * segments * segments - 3 * segments) // 2
+
+
+def _output_dtypes(iterations, compact):
+    if not compact:
+        return {'vertices': np.float64, 'faces': np.int64, 'edges': np.int64, 'face_edges': np.int64}
+
+    # Vertices stay float64 for the rest of the build, as in the serial build, so both give the same caps
+    vertex_index = geometry.index_dtype(_vertex_count(iterations))
+    edge_index = geometry.index_dtype(30 * 4 ** iterations)
+    return {'vertices': np.float64, 'faces': vertex_index, 'edges': vertex_index, 'face_edges': edge_index}
+
+
+def _output_shapes(iterations):
+    return {
+        'vertices': (_vertex_count(iterations), 3),
+        'faces': (20 * 4 ** iterations, 3),
+        'edges': (30 * 4 ** iterations, 2),
+        'face_edges': (20 * 4 ** iterations, 3),
+    }
+
+
+def _edge_ids(level, base_face, corners, barycentric, edges, base_edge_ids):
+    """
+    Work out the global number of every local edge of a base face at one level.
+
+    Args:
+        level (int): Subdivision level of the local mesh.
+        base_face (int): Index of the base face.
+        corners (numpy.ndarray): The base face's 3 vertex indices.
+        barycentric (numpy.ndarray): (n, 3) integer barycentric coordinates of the local vertices.
+        edges (numpy.ndarray): (E, 2) local edge table.
+        base_edge_ids (dict): Base edge number by (lower, higher) base vertex index.
+
+    Returns:
+        numpy.ndarray: The global edge numbers.
+    """
+    p, q = edges[:, 0], edges[:, 1]
+    segments = 2 ** level
+
+    # The sides of the base face, as (first corner, second corner) and the barycentric coordinate that is zero
+    # along them
+    edge_ids = np.full(len(edges), -1, dtype=np.int64)
+    for first, second, zero in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        on_side = (barycentric[p, zero] == 0) & (barycentric[q, zero] == 0)
+        a, b = int(corners[first]), int(corners[second])
+
+        # Position along the base edge, measured from its lower vertex index
+        if a < b:
+            along = np.minimum(barycentric[p[on_side], second], barycentric[q[on_side], second])
+        else:
+            along = np.minimum(barycentric[p[on_side], first], barycentric[q[on_side], first])
+        edge_ids[on_side] = base_edge_ids[(min(a, b), max(a, b))] * segments + along
+
+    interior = edge_ids < 0
+    interior_count = _interior_edge_count(level)
+    assert np.count_nonzero(interior) == interior_count
+    edge_ids[interior] = 30 * segments + base_face * interior_count + np.arange(interior_count)
+    return edge_ids
+
+
+def _pool_context():
+    # Workers start from a fresh interpreter rather than as a fork of the caller, which is usually a thread of the
+    # game running alongside pygame's: a fork copies that process's threads' locks in whatever state they are in
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _serial_order(faces, iterations):
+    """
+    Work out the index the serial build gives every vertex of the parallel build.
+
+    The two builds share their faces, in the same order, and their vertices up to the order within each level. The
+    serial build numbers the midpoints of level l by the sorted edge table of that level's faces, so the new index
+    of every vertex follows level by level from the faces alone.
+
+    Args:
+        faces (numpy.ndarray): (F, 3) array of the finest faces, in the parallel build's vertex numbering.
+        iterations (int): Number of subdivision iterations.
+
+    Returns:
+        numpy.ndarray: The serial index of every parallel vertex index.
+    """
+    order = np.empty(_vertex_count(iterations), dtype=np.int64)
+    order[:12] = np.arange(12)
+    level_faces = geometry.face_hierarchy(faces, iterations)
+    for level in range(iterations):
+        # The middle child of every face has the face's ab, bc and ca midpoints as its corners, and the serial
+        # build numbers those midpoints after the level's vertices by its edge table
+        _, face_edges = geometry.edge_table(order[level_faces[level]])
+        order[level_faces[level + 1][3::4]] = _vertex_count(level) + face_edges
+    return order
+
+
+def _subdivide_base_face(base_face, iterations, base_vertices, base_faces, names, compact):
+    """
+    Subdivide one base face and write its vertices, faces and edges into the shared output arrays.
+
+    Args:
+        base_face (int): Index of the base face in base_faces.
+        iterations (int): Number of subdivision iterations.
+        base_vertices (numpy.ndarray): (12, 3) array of base vertices.
+        base_faces (numpy.ndarray): (20, 3) array of base faces.
+        names (dict): Names of the shared memory blocks for the 'vertices', 'faces', 'edges' and 'face_edges'
+            output arrays.
+        compact (bool): Whether the output arrays use compact storage.
+    """
+    base_edges, _ = geometry.edge_table(base_faces)
+    base_edge_ids = {(int(a), int(b)): e for e, (a, b) in enumerate(base_edges)}
+    corners = base_faces[base_face]
+
+    # Local mesh of this face. Every vertex also keeps its global index and its integer barycentric coordinates
+    # on the base face corners, which add up to 2^l at level l.
+    positions = base_vertices[corners]
+    faces = np.array([[0, 1, 2]])
+    global_ids = corners.astype(np.int64)
+    barycentric = np.eye(3, dtype=np.int64)
+
+    for level in range(iterations + 1):
+        edges, face_edges = geometry.edge_table(faces)
+        edge_ids = _edge_ids(level, base_face, corners, barycentric, edges, base_edge_ids)
+        if level == iterations:
+            break
+
+        positions, faces = geometry.subdivide_once(positions, faces, (edges, face_edges))
+        global_ids = np.concatenate([global_ids, _vertex_count(level) + edge_ids])
+        barycentric = np.concatenate([barycentric * 2, barycentric[edges[:, 0]] + barycentric[edges[:, 1]]])
+
+    memories = {name: shared_memory.SharedMemory(name=block) for name, block in names.items()}
+    try:
+        shapes = _output_shapes(iterations)
+        dtypes = _output_dtypes(iterations, compact)
+        arrays = {name: np.ndarray(shapes[name], dtype=dtypes[name], buffer=memory.buf)
+                  for name, memory in memories.items()}
+
+        # Vertices and edges along the base edges are written by both neighbouring faces, with identical values
+        arrays['vertices'][global_ids] = positions
+        arrays['edges'][edge_ids] = np.sort(global_ids[edges], axis=1)
+        block = slice(base_face * 4 ** iterations, (base_face + 1) * 4 ** iterations)
+        arrays['faces'][block] = global_ids[faces]
+        arrays['face_edges'][block] = edge_ids[face_edges]
+        del arrays
+    finally:
+        for memory in memories.values():
+            memory.close()
+
+
+def subdivide(base_vertices, base_faces, iterations, workers=None, progress_callback=None, compact=False):
+    """
+    Subdivide the icosahedron with a process pool, one task per base face.
+
+    Args:
+        base_vertices (numpy.ndarray): (12, 3) array of base vertices.
+        base_faces (numpy.ndarray): (20, 3) array of base faces.
+        iterations (int): Number of subdivision iterations.
+        workers (int): Number of worker processes. Defaults to the number of CPU cores.
+        progress_callback (callable): Called with the fraction of base faces done after each one finishes. Any
+            exception it raises cancels the remaining tasks and is passed on.
+        compact (bool): Write the index arrays in the narrowest unsigned integer types, as in
+            geometry.compact_arrays, instead of int64. The vertices are float64 either way.
+
+    Returns:
+        tuple: The subdivided (vertices, faces) arrays, numbered as geometry.subdivide numbers them, and an
+        (edges, face_edges) edge table of the result in the same form as geometry.edge_table, though with the edges
+        in another order.
+    """
+    base_faces = np.asarray(base_faces, dtype=np.int64)
+    shapes = _output_shapes(iterations)
+    dtypes = _output_dtypes(iterations, compact)
+
+    memories = {name: shared_memory.SharedMemory(
+        create=True, size=int(np.prod(shape)) * np.dtype(dtypes[name]).itemsize)
+        for name, shape in shapes.items()}
+    names = {name: memory.name for name, memory in memories.items()}
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=_pool_context())
+    try:
+        futures = [executor.submit(_subdivide_base_face, base_face, iterations, base_vertices, base_faces, names,
+                                   compact)
+                   for base_face in range(len(base_faces))]
+        for done, future in enumerate(as_completed(futures), 1):
+            future.result()
+            if progress_callback is not None:
+                progress_callback(done / len(futures))
+
+        shared = {name: np.ndarray(shapes[name], dtype=dtypes[name], buffer=memory.buf)
+                  for name, memory in memories.items()}
+
+        # Renumber the vertices into the serial build's order, each array copied out of shared memory as it goes
+        order = _serial_order(shared['faces'], iterations).astype(dtypes['faces'])
+        vertices = np.empty_like(shared['vertices'])
+        vertices[order] = shared['vertices']
+        faces = order[shared['faces']]
+        edges = order[shared['edges']]
+        edges.sort(axis=1)
+        face_edges = shared['face_edges'].copy()
+        del order, shared
+        return vertices, faces, edges, face_edges
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for memory in memories.values():
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,296 @@
+from collections import OrderedDict
+import numpy as np
+from config import PATH_CACHE_SIZE
+
+# Shortest paths over the globe's mesh, for moving units around.
+#
+# Nodes are either the globe's vertices (its tiles, see tiles) or the faces of its finest level, and two nodes are
+# connected when they share an edge. Moving between neighbours costs the great-circle distance between them times
+# the average movement cost of the two nodes, which comes from the terrain (BIOME_MOVE_COSTS) and is infinite where
+# units cannot go.
+#
+# Two kinds of query are supported:
+#
+#   - find_path: A* from one node to another, guided by the great-circle distance to the goal times the cheapest
+#     movement cost, which never overestimates, so the path found is a shortest one. Recent paths are kept in an
+#     LRU cache of PATH_CACHE_SIZE entries.
+#   - distance_field: the distance from the nearest of many sources to every node, grown from all of them at once,
+#     e.g. to find everywhere any unit can reach this turn.
+#
+# Both expand nodes in whole-array steps rather than one at a time off a heap (delta-stepping): every pending node
+# within a bucket width of the closest one is relaxed at once, and nodes relaxed too early are simply relaxed again
+# when a shorter distance reaches them.
+
+# Cost of moving through every biome per unit of great-circle distance, indexed like terrain.BIOME_NAMES
+BIOME_MOVE_COSTS = np.array([np.inf, np.inf, 1.0, 1.5, 1.0, 2.0, 1.5, 3.0, 4.0], dtype=np.float32)
+
+# The distance field relaxes, at each step, every pending node within this many of the longest edges at the cheapest
+# cost of the closest pending node. Larger values take fewer steps but relax more nodes more than once.
+_BUCKET_EDGES = 4
+
+
+class Pathfinder:
+    """Shortest paths and distance fields over the vertices or faces of a globe."""
+
+    NODE_KINDS = ('vertices', 'faces')
+
+    def __init__(self, globe, nodes='vertices'):
+        """
+        Create a pathfinder for a globe. Costs and positions are only worked out when first needed.
+
+        Args:
+            globe (Icosphere): The globe to move over.
+            nodes (str): What units move between, one of NODE_KINDS: 'vertices' (the tiles) or 'faces' (the
+                triangles of the finest level).
+        """
+        if nodes not in self.NODE_KINDS:
+            raise ValueError("nodes must be one of {}, not {!r}".format(self.NODE_KINDS, nodes))
+        self.globe = globe
+        self.nodes = nodes
+        self.adjacency = globe.vertex_adjacency if nodes == 'vertices' else globe.face_adjacency
+        self._costs = None
+        self._paths = OrderedDict()
+
+    def __len__(self):
+        return len(self.adjacency)
+
+    def positions(self, nodes):
+        """
+        Get the positions of nodes on the unit sphere.
+
+        Args:
+            nodes (numpy.ndarray): Node indices.
+
+        Returns:
+            numpy.ndarray: (N, 3) float64 array of positions. Faces are placed at their centroids.
+        """
+        # Plain views of the mesh arrays, which skip numpy.memmap's per-lookup overhead
+        nodes = np.asarray(nodes, dtype=np.int64)
+        vertices = np.asarray(self.globe.vertices)
+        if self.nodes == 'vertices':
+            return vertices[nodes].astype(np.float64)
+        faces = np.asarray(self.globe.faces)[nodes]
+        centroids = (vertices[faces[..., 0]].astype(np.float64) + vertices[faces[..., 1]] + vertices[faces[..., 2]])
+        return centroids / np.linalg.norm(centroids, axis=-1)[..., np.newaxis]
+
+    @staticmethod
+    def great_circle(a, b):
+        """
+        Get the great-circle distances between pairs of points on the unit sphere.
+
+        Args:
+            a (numpy.ndarray): (N, 3) array of points.
+            b (numpy.ndarray): Points broadcast against a, such as a single point.
+
+        Returns:
+            numpy.ndarray: The angles in radians, shaped like a and b broadcast together without the last axis.
+        """
+        # From the chord length, which unlike the dot product stays accurate between close neighbours
+        offsets = a - b
+        chords = np.sqrt(np.einsum('...i,...i->...', offsets, offsets))
+        return 2.0 * np.arcsin(np.minimum(chords * 0.5, 1.0))
+
+    @property
+    def costs(self):
+        """(N,) float32 movement cost of every node, infinite where units cannot go."""
+        if self._costs is None:
+            costs = BIOME_MOVE_COSTS[self.globe.terrain.biome]
+            if self.nodes == 'faces':
+                costs = costs[self.globe.faces].mean(axis=1, dtype=np.float32)
+            self._costs = costs
+        return self._costs
+
+    def set_costs(self, costs):
+        """
+        Replace the movement cost of every node, e.g. after the terrain has changed.
+
+        Args:
+            costs (numpy.ndarray): (N,) array of costs, infinite where units cannot go.
+        """
+        costs = np.asarray(costs, dtype=np.float32)
+        if costs.shape != (len(self),):
+            raise ValueError("Expected {} costs, got shape {}".format(len(self), costs.shape))
+        self._costs = costs.copy()
+        self._paths.clear()
+
+    def update_costs(self, nodes, costs):
+        """
+        Change the movement cost of some nodes.
+
+        Cached paths are only dropped where the change can affect them: when no cost went down, only the paths
+        through the changed nodes, since every other path stays as cheap as before and no alternative got cheaper.
+        Otherwise the whole cache is cleared.
+
+        Args:
+            nodes (numpy.ndarray): Indices of the nodes to change.
+            costs (numpy.ndarray): Their new costs, or one cost for all of them.
+        """
+        nodes = np.atleast_1d(np.asarray(nodes, dtype=np.int64))
+        new_costs = np.broadcast_to(np.asarray(costs, dtype=np.float32), nodes.shape)
+        increased_only = bool(np.all(new_costs >= self.costs[nodes]))
+        self._costs[nodes] = new_costs
+
+        if not increased_only:
+            self._paths.clear()
+            return
+        for key in [key for key, path in self._paths.items() if path is not None and np.isin(path, nodes).any()]:
+            del self._paths[key]
+
+    def _edge_costs(self, owners, neighbors):
+        # Cost of the moves from owners to neighbours: their distance times the two nodes' average cost
+        costs = self.costs
+        return (self.great_circle(self.positions(owners), self.positions(neighbors)) *
+                (0.5 * (costs[owners].astype(np.float64) + costs[neighbors])))
+
+    def _cheapest_cost(self):
+        finite = self.costs[np.isfinite(self.costs)]
+        return float(finite.min()) if len(finite) else np.inf
+
+    def _bucket_width(self):
+        return _BUCKET_EDGES * float(self.globe._mesh_arrays['max_edge_length'][0]) * self._cheapest_cost()
+
+    def _relax(self, owners, field, limit):
+        """
+        Try to shorten the distances of the neighbours of some nodes by going through them.
+
+        Args:
+            owners (numpy.ndarray): The nodes to go through.
+            field (numpy.ndarray): Distances of every node so far.
+            limit (float): Distances past this are left out.
+
+        Returns:
+            tuple: (owners, neighbors, distances) of the neighbours that got closer, each reached from the owner
+            that gives it the shortest distance.
+        """
+        indptr, indices = np.asarray(self.adjacency.indptr), np.asarray(self.adjacency.indices)
+
+        # Every (owner, neighbour) pair, from the owners' rows of the adjacency
+        starts = indptr[owners].astype(np.int64)
+        counts = indptr[owners + 1].astype(np.int64) - starts
+        entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        owners = np.repeat(owners, counts)
+        neighbors = indices[entries].astype(np.int64)
+        candidates = field[owners] + self._edge_costs(owners, neighbors)
+
+        better = (candidates < field[neighbors]) & (candidates <= limit)
+        owners, neighbors, candidates = owners[better], neighbors[better], candidates[better]
+
+        # Keep the best candidate for every neighbour reached more than once
+        order = np.lexsort((candidates, neighbors))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = neighbors[order[1:]] != neighbors[order[:-1]]
+        best = order[first]
+        return owners[best], neighbors[best], candidates[best]
+
+    def find_path(self, start, goal):
+        """
+        Find a shortest path between two nodes with A*.
+
+        Args:
+            start (int): The node to start from.
+            goal (int): The node to reach.
+
+        Returns:
+            numpy.ndarray: The nodes along the path, start and goal included, or None if the goal cannot be reached.
+            Paths come from the cache, so do not change them.
+        """
+        key = (int(start), int(goal))
+        if key in self._paths:
+            self._paths.move_to_end(key)
+            return self._paths[key]
+
+        path = self._search(*key)
+        if path is not None:
+            path.flags.writeable = False
+        self._paths[key] = path
+        if len(self._paths) > PATH_CACHE_SIZE:
+            self._paths.popitem(last=False)
+        return path
+
+    def _search(self, start, goal):
+        """
+        A* in whole-array steps: rather than expanding one node at a time, every pending node whose estimated total
+        is within a bucket width of the lowest one is expanded at once.
+
+        The estimate is the distance so far plus the great-circle distance left at the cheapest movement cost. That
+        never overestimates and never drops by more than a move costs, so once no pending node has an estimate below
+        the goal's distance, that distance is final.
+        """
+        costs = self.costs
+        if not (np.isfinite(costs[start]) and np.isfinite(costs[goal])):
+            return None
+
+        goal_position = self.positions([goal])[0]
+        cheapest = self._cheapest_cost()
+        bucket = self._bucket_width()
+
+        field = np.full(len(self), np.inf)
+        previous = np.full(len(self), -1, dtype=np.int64)
+        field[start] = 0.0
+        pending = np.array([start], dtype=np.int64)
+        while len(pending):
+            estimates = field[pending] + self.great_circle(self.positions(pending), goal_position) * cheapest
+            lowest = estimates.min()
+            if lowest >= field[goal]:
+                break
+            now = estimates <= lowest + bucket
+            owners, neighbors, distances = self._relax(pending[now], field, field[goal])
+            field[neighbors] = distances
+            previous[neighbors] = owners
+            pending = np.union1d(pending[~now], neighbors)
+
+        if not np.isfinite(field[goal]):
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(previous[path[-1]]))
+        return np.array(path[::-1], dtype=np.int64)
+
+    def distance_field(self, sources, budgets=None, max_distance=np.inf):
+        """
+        Grow the shortest distances from many sources at once.
+
+        Args:
+            sources (numpy.ndarray): Indices of the source nodes, e.g. where every unit stands.
+            budgets (numpy.ndarray): How far each source can go, e.g. every unit's movement left this turn. Nodes are
+                then reached by whichever source has the most budget left there.
+            max_distance (float): Stop growing the field past this distance, when no budgets are given.
+
+        Returns:
+            tuple: (distances, nearest) arrays over every node: the distance from the source that reaches it, infinite
+            where none does, and that source's position in sources, or -1.
+        """
+        sources = np.atleast_1d(np.asarray(sources, dtype=np.int64))
+        if budgets is None:
+            offsets = np.zeros(len(sources))
+            limit = float(max_distance)
+        else:
+            # Measure from every source's budget, so one field covers sources with different budgets: a node is
+            # reachable when its value is at most 0, and the source with the most budget left there reaches it.
+            offsets = -np.broadcast_to(np.asarray(budgets, dtype=np.float64), sources.shape)
+            limit = 0.0
+
+        field = np.full(len(self), np.inf)
+        nearest = np.full(len(self), -1, dtype=np.int64)
+
+        # Sources in order of their starting value, so the lowest one wins where several share a node
+        usable = np.isfinite(self.costs[sources]) & (offsets <= limit)
+        order = np.flatnonzero(usable)[np.argsort(offsets[usable], kind='stable')[::-1]]
+        field[sources[order]] = offsets[order]
+        nearest[sources[order]] = order
+        pending = np.unique(sources[order])
+
+        bucket = self._bucket_width()
+        while len(pending):
+            # Relax the pending nodes closest to the sources first, leaving the rest until these have settled
+            values = field[pending]
+            now = values <= values.min() + bucket
+            owners, neighbors, distances = self._relax(pending[now], field, limit)
+            field[neighbors] = distances
+            nearest[neighbors] = nearest[owners]
+            pending = np.union1d(pending[~now], neighbors)
+
+        if budgets is not None:
+            reached = nearest >= 0
+            field[reached] -= offsets[nearest[reached]]
+        return field, nearest
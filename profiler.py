@@ -0,0 +1,244 @@
+import json
+import time
+from contextlib import nullcontext
+import numpy as np
+from config import PROFILER_ENABLED, PROFILER_HISTORY
+
+# Per-frame timing of the main loop's stages.
+#
+# Code marks a stage with `with frame_profiler.scope('name'):`, and the main loop brackets every frame with
+# begin_frame and end_frame. Each frame's stage times (the total of every scope of that name within the frame) and
+# counters go into ring buffers holding the last PROFILER_HISTORY frames, from which summary works out the frame rate
+# and frame time percentiles. Stages are named '<parent>.<child>' when one runs inside another.
+#
+# While disabled, scope hands back one shared do-nothing context manager and the other calls return straight away,
+# so instrumented code costs a method call per scope.
+
+# Percentiles of the frame time shown in the summary
+PERCENTILES = (50, 95, 99)
+
+_NULL_SCOPE = nullcontext()
+
+
+class _Scope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._add(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    """Named timing scopes with the samples of the last frames kept in ring buffers."""
+
+    def __init__(self, history=PROFILER_HISTORY, enabled=PROFILER_ENABLED):
+        """
+        Args:
+            history (int): Number of frames kept.
+            enabled (bool): Whether to record from the start.
+        """
+        self.history = history
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded frame."""
+        self.frames = 0
+        self._frame_starts = np.zeros(self.history)
+        self._frame_times = np.zeros(self.history)
+
+        # Per stage and counter, one slot per frame: a stage's start (from its frame's start) and total time in
+        # milliseconds, NaN in frames where it did not run
+        self._stage_offsets = {}
+        self._stage_times = {}
+        self._counters = {}
+
+        self._frame_start = None
+        self._current_stages = {}
+        self._current_counters = {}
+
+    def set_enabled(self, enabled):
+        """
+        Start or stop recording. Starting again begins from an empty history.
+
+        Args:
+            enabled (bool): Whether to record.
+        """
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+        self._frame_start = None
+
+    def begin_frame(self):
+        if self.enabled:
+            self._frame_start = time.perf_counter()
+            self._current_stages.clear()
+            self._current_counters.clear()
+
+    def end_frame(self):
+        if not self.enabled or self._frame_start is None:
+            return
+        slot = self.frames % self.history
+        self._frame_starts[slot] = self._frame_start
+        self._frame_times[slot] = (time.perf_counter() - self._frame_start) * 1000
+
+        for name, (offset, total) in self._current_stages.items():
+            if name not in self._stage_times:
+                self._stage_offsets[name] = np.full(self.history, np.nan)
+                self._stage_times[name] = np.full(self.history, np.nan)
+            self._stage_offsets[name][slot] = offset * 1000
+            self._stage_times[name][slot] = total * 1000
+        for name, times in self._stage_times.items():
+            if name not in self._current_stages:
+                times[slot] = np.nan
+
+        for name, value in self._current_counters.items():
+            if name not in self._counters:
+                self._counters[name] = np.full(self.history, np.nan)
+            self._counters[name][slot] = value
+        for name, values in self._counters.items():
+            if name not in self._current_counters:
+                values[slot] = np.nan
+
+        self.frames += 1
+        self._frame_start = None
+
+    def scope(self, name):
+        """
+        Time a stage of the current frame.
+
+        Args:
+            name (str): The stage.
+
+        Returns:
+            A context manager timing its block, adding to the stage's total when it runs more than once a frame.
+        """
+        if self._frame_start is None:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def _add(self, name, start, stop):
+        if self._frame_start is None:
+            return
+        entry = self._current_stages.get(name)
+        if entry is None:
+            self._current_stages[name] = [start - self._frame_start, stop - start]
+        else:
+            entry[1] += stop - start
+
+    def count(self, name, value):
+        """
+        Record a counter for the current frame, such as the number of faces drawn.
+
+        Args:
+            name (str): The counter.
+            value (float): Its value this frame.
+        """
+        if self._frame_start is not None:
+            self._current_counters[name] = value
+
+    def _order(self):
+        # Slots of the recorded frames, oldest first
+        count = min(self.frames, self.history)
+        return (np.arange(count) + self.frames - count) % self.history
+
+    def summary(self):
+        """
+        Summarize the recorded frames.
+
+        Returns:
+            dict: 'frames' recorded, 'fps' from the time between the first and last frame, 'frame_ms' percentiles by
+            PERCENTILES, 'stages' with the mean and 95th percentile time of every stage in milliseconds, over the
+            frames it ran in, and 'counters' with the latest value of every counter. None if nothing was recorded.
+        """
+        order = self._order()
+        if len(order) == 0:
+            return None
+
+        starts = self._frame_starts[order]
+        span = starts[-1] - starts[0]
+        frame_times = self._frame_times[order]
+        stages = {}
+        for name, times in sorted(self._stage_times.items()):
+            times = times[order]
+            times = times[~np.isnan(times)]
+            if len(times):
+                stages[name] = {'mean_ms': float(times.mean()), 'p95_ms': float(np.percentile(times, 95))}
+        counters = {}
+        for name, values in sorted(self._counters.items()):
+            values = values[order]
+            values = values[~np.isnan(values)]
+            if len(values):
+                counters[name] = float(values[-1])
+
+        return {
+            'frames': len(order),
+            'fps': (len(order) - 1) / span if span > 0 else 0.0,
+            'frame_ms': {p: float(value) for p, value in zip(PERCENTILES, np.percentile(frame_times, PERCENTILES))},
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def report_lines(self):
+        """
+        Format the summary as lines of text for the debug console.
+
+        Returns:
+            list: The lines.
+        """
+        summary = self.summary()
+        if summary is None:
+            return ["No frames recorded yet."]
+
+        lines = [
+            "FPS: {:.1f} over the last {} frames".format(summary['fps'], summary['frames']),
+            "Frame time: " + ", ".join("p{} {:.2f} ms".format(p, value) for p, value in summary['frame_ms'].items()),
+        ]
+        for name, value in summary['counters'].items():
+            lines.append("{}: {:.0f}".format(name.replace('_', ' ').capitalize(), value))
+        for name, times in summary['stages'].items():
+            indent = "  " * name.count('.')
+            lines.append("{}{}: {:.2f} ms (p95 {:.2f} ms)".format(indent, name, times['mean_ms'], times['p95_ms']))
+        return lines
+
+    def dump(self, path):
+        """
+        Write the recorded frames as a trace in the Chrome trace event format, viewable in chrome://tracing or
+        Perfetto: every frame and stage becomes a complete event and every counter a counter event.
+
+        Args:
+            path (str): The file to write.
+
+        Returns:
+            int: The number of frames written.
+        """
+        order = self._order()
+        origin = self._frame_starts[order[0]] if len(order) else 0.0
+        events = []
+        for slot in order.tolist():
+            start = (self._frame_starts[slot] - origin) * 1e6
+            events.append({'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': start,
+                           'dur': self._frame_times[slot] * 1000})
+            for name, times in self._stage_times.items():
+                if not np.isnan(times[slot]):
+                    events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                                   'ts': start + self._stage_offsets[name][slot] * 1000, 'dur': times[slot] * 1000})
+            for name, values in self._counters.items():
+                if not np.isnan(values[slot]):
+                    events.append({'name': name, 'ph': 'C', 'pid': 0, 'ts': start, 'args': {name: values[slot]}})
+
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        return len(order)
+
+
+# The profiler the main loop and the globe report to
+frame_profiler = Profiler()
@@ -0,0 +1,137 @@
+import numpy as np
+import pygame
+
+# Software rasterizer that writes lines and triangles straight into a Surface's pixels with NumPy.
+#
+# pygame.draw costs one call from Python into C per line or polygon, which dominates once thousands of faces are
+# on screen. Here every pixel covered by a batch is worked out with array operations and written with a single
+# fancy-indexed assignment into pygame.surfarray.pixels2d, so the Python overhead is per batch instead of per
+# shape. Shapes are clipped to the surface, and later shapes in a batch overwrite earlier ones.
+#
+# The cost is per pixel instead: every pixel written takes an index and a color of its own. That is cheap for the
+# thin lines of a wireframe, but pygame fills large triangles faster than the pixels can be listed.
+
+
+def map_colors(surface, colors):
+    """
+    Convert RGB colors to the surface's pixel format.
+
+    Args:
+        surface (pygame.Surface): The surface the colors are for. It must be 16 or 32 bits per pixel.
+        colors (numpy.ndarray): (N, 3) array of RGB colors, or a single RGB color.
+
+    Returns:
+        numpy.ndarray: Mapped pixel values, shaped like colors without its last axis.
+    """
+    colors = np.asarray(colors, dtype=np.uint32)
+    r_shift, g_shift, b_shift, _ = surface.get_shifts()
+    r_loss, g_loss, b_loss, _ = surface.get_losses()
+    return (((colors[..., 0] >> r_loss) << r_shift) | ((colors[..., 1] >> g_loss) << g_shift) |
+            ((colors[..., 2] >> b_loss) << b_shift))
+
+
+def supports(surface):
+    """Whether a surface's pixel format can be rasterized into."""
+    return surface.get_bitsize() in (16, 32)
+
+
+def _write(surface, indices, values):
+    """
+    Write pixel values into a surface.
+
+    Args:
+        surface (pygame.Surface): The surface to write to.
+        indices (numpy.ndarray): Row-major pixel indices, y * width + x.
+        values (numpy.ndarray): Mapped pixel values, one per index or a single one for all of them.
+    """
+    pixels = pygame.surfarray.pixels2d(surface)
+    try:
+        # pixels2d is indexed [x, y]. Its transpose is row-major, and when rows are not padded it can be written
+        # through a flat view, which is much faster than indexing with separate x and y arrays.
+        rows = pixels.T
+        if rows.flags['C_CONTIGUOUS']:
+            rows.reshape(-1)[indices] = values
+        else:
+            width = surface.get_width()
+            pixels[indices % width, indices // width] = values
+    finally:
+        del pixels
+
+
+def draw_lines(surface, starts, ends, color):
+    """
+    Draw 1 pixel wide line segments.
+
+    Args:
+        surface (pygame.Surface): The surface to draw on.
+        starts (numpy.ndarray): (N, 2) integer array of segment start points.
+        ends (numpy.ndarray): (N, 2) integer array of segment end points.
+        color (tuple): The RGB line color.
+    """
+    starts = np.asarray(starts, dtype=np.int64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+    if len(starts) == 0:
+        return
+
+    # Step one pixel at a time along the longer axis of every segment, including both end points
+    deltas = ends - starts
+    steps = np.abs(deltas).max(axis=1)
+    counts = steps + 1
+    segment = np.repeat(np.arange(len(starts)), counts)
+    position = np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = position / np.maximum(steps, 1)[segment]
+    x = starts[segment, 0] + np.rint(deltas[segment, 0] * fraction).astype(np.int64)
+    y = starts[segment, 1] + np.rint(deltas[segment, 1] * fraction).astype(np.int64)
+
+    width, height = surface.get_size()
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    _write(surface, y[inside] * width + x[inside], map_colors(surface, color))
+
+
+def fill_triangles(surface, triangles, colors):
+    """
+    Fill triangles, each in its own color.
+
+    Every triangle is cut into one horizontal span of pixels per row it covers, and the spans of the whole batch are
+    expanded into pixels and written at once.
+
+    Args:
+        surface (pygame.Surface): The surface to draw on.
+        triangles (numpy.ndarray): (N, 3, 2) integer array of corner positions.
+        colors (numpy.ndarray): (N, 3) array of RGB colors.
+    """
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3, 2)
+    if len(triangles) == 0:
+        return
+    width, height = surface.get_size()
+    mapped = map_colors(surface, colors)
+
+    # Rows covered by every triangle, clipped to the surface
+    top = np.maximum(triangles[:, :, 1].min(axis=1), 0)
+    bottom = np.minimum(triangles[:, :, 1].max(axis=1), height - 1)
+    rows = np.maximum(bottom - top + 1, 0)
+
+    spans = np.repeat(np.arange(len(triangles)), rows)
+    y = top[spans] + np.arange(len(spans)) - np.repeat(np.cumsum(rows) - rows, rows)
+
+    # Where each row crosses the triangle's edges. Edges that do not reach the row are left out of the min and max.
+    left = np.full(len(spans), np.inf)
+    right = np.full(len(spans), -np.inf)
+    for first, second in ((0, 1), (1, 2), (2, 0)):
+        x0, y0 = triangles[spans, first, 0], triangles[spans, first, 1]
+        x1, y1 = triangles[spans, second, 0], triangles[spans, second, 1]
+        crosses = (y >= np.minimum(y0, y1)) & (y <= np.maximum(y0, y1))
+        dy = y1 - y0
+        x = np.where(dy != 0, x0 + (y - y0) * (x1 - x0) / np.where(dy != 0, dy, 1), np.minimum(x0, x1))
+        np.minimum(left, np.where(crosses, x, np.inf), out=left)
+        # A horizontal edge covers its whole length
+        x = np.where(dy != 0, x, np.maximum(x0, x1))
+        np.maximum(right, np.where(crosses, x, -np.inf), out=right)
+
+    left = np.maximum(np.rint(left), 0).astype(np.int64)
+    right = np.minimum(np.rint(right), width - 1).astype(np.int64)
+    lengths = np.maximum(right - left + 1, 0)
+
+    # Expand the spans into row-major pixel indices: each span's first pixel, then consecutive ones after it
+    indices = np.repeat(y * width + left - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    _write(surface, indices, np.repeat(mapped[spans], lengths))
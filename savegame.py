@@ -0,0 +1,407 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections.abc import MutableMapping
+import numpy as np
+import geometry
+import terrain
+from config import SAVE_DIR, SAVE_COMPRESSION_LEVEL
+
+# Saved games: one binary .globe file per globe.
+#
+# The mesh itself is not stored, since it is fully determined by the preset and comes back from the mesh cache (or
+# is rebuilt) on load. What a save holds is everything that cannot be recomputed for free: the preset, the view
+# (orientation, scale and display settings, left out for pre-generated maps), and per-vertex and per-face layers
+# such as the terrain and the face colors already built for the filled mode. Writing only needs NumPy; loading
+# builds an Icosphere.
+#
+# File layout:
+#
+#   magic (8 bytes) | format version (uint32) | header length (uint32) | JSON header | padding | chunk data
+#
+# The header describes every layer (dtype, shape and its list of chunks) and the chunk data follows, aligned to
+# _ALIGNMENT. Layers are cut into chunks of about SAVE_CHUNK_BYTES and each chunk is zlib compressed, or kept raw
+# when compression does not make it smaller. Loading memory maps the file and only reads the header, so opening a
+# save is quick whatever its size; a layer's chunks are decompressed the first time it is used.
+
+MAGIC = b'ICOSAVE\0'
+
+# Bump when the file layout changes; older saves are refused rather than misread
+FORMAT_VERSION = 1
+
+# File extension of saved games in SAVE_DIR
+SAVE_EXTENSION = '.globe'
+
+# Uncompressed size of a layer chunk
+SAVE_CHUNK_BYTES = 4 << 20
+
+_PREAMBLE = struct.Struct('<8sII')
+_ALIGNMENT = 64
+
+
+class SaveFormatError(ValueError):
+    """Raised when a file is not a saved game this version can read."""
+
+
+class LazyLayers(MutableMapping):
+    """
+    The layers of a saved game by name, each decompressed from the file the first time it is looked up.
+
+    Layers can also be set and replaced like in a dict, so the mapping can stand in for the dicts the globe keeps
+    its arrays in.
+    """
+
+    def __init__(self, buffer, data_start, layers):
+        """
+        Args:
+            buffer (mmap.mmap): The whole save file.
+            data_start (int): Offset of the chunk data in the file.
+            layers (dict): The header's layer descriptions by name.
+        """
+        self._buffer = buffer
+        self._data_start = data_start
+        self._layers = layers
+        self._loaded = {}
+
+    def __contains__(self, name):
+        # Without loading the layer, as the default would
+        return name in self._loaded or name in self._layers
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            if name not in self._layers:
+                raise KeyError(name)
+            self._loaded[name] = self._read(self._layers[name])
+        return self._loaded[name]
+
+    def __setitem__(self, name, array):
+        self._loaded[name] = array
+
+    def __delitem__(self, name):
+        if name not in self._loaded and name not in self._layers:
+            raise KeyError(name)
+        self._loaded.pop(name, None)
+        self._layers = {key: layer for key, layer in self._layers.items() if key != name}
+
+    def __iter__(self):
+        return iter(list(self._layers) + [name for name in self._loaded if name not in self._layers])
+
+    def __len__(self):
+        return len(set(self._layers) | set(self._loaded))
+
+    def layer_nbytes(self, name):
+        """
+        Get the size of a layer, from the header while it is still in the file.
+
+        Args:
+            name (str): The layer.
+
+        Returns:
+            int: Its size in bytes once loaded.
+        """
+        if name in self._loaded:
+            return self._loaded[name].nbytes
+        if name not in self._layers:
+            raise KeyError(name)
+        return _layer_nbytes(self._layers[name])
+
+    def close(self):
+        """
+        Read every layer still in the file into memory and close the file, so it can be replaced. The mapping
+        keeps working from memory afterwards.
+        """
+        for name, layer in self._layers.items():
+            if name not in self._loaded:
+                self._loaded[name] = self._read(layer)
+        self._buffer.close()
+
+    def _read(self, layer):
+        # Decompress every chunk straight into its place in the layer's array
+        array = np.empty(layer['shape'], dtype=layer['dtype'])
+        out = array.reshape(-1).view(np.uint8)
+        position = 0
+        for offset, stored, raw, compressed in layer['chunks']:
+            start = self._data_start + offset
+            data = self._buffer[start:start + stored]
+            if compressed:
+                try:
+                    data = zlib.decompress(data)
+                except zlib.error as e:
+                    raise SaveFormatError('A layer of the saved game is damaged: {}'.format(e)) from e
+            if len(data) != raw:
+                raise SaveFormatError('A layer of the saved game is damaged: a chunk has {} bytes, expected {}'.format(
+                    len(data), raw))
+            out[position:position + raw] = np.frombuffer(data, np.uint8)
+            position += raw
+        return array
+
+
+def _layer_nbytes(layer):
+    return int(np.prod(layer['shape'], dtype=np.int64)) * np.dtype(layer['dtype']).itemsize
+
+
+def _check_layers(path, header, size, data_start):
+    """
+    Check that the chunks of every layer lie within the file and add up to the layer's size, so a truncated or
+    mangled save is refused on load rather than when a layer is first used.
+
+    Raises:
+        SaveFormatError: If they do not.
+    """
+    for name, layer in header['layers'].items():
+        chunks = layer['chunks']
+        if sum(raw for _, _, raw, _ in chunks) != _layer_nbytes(layer):
+            raise SaveFormatError('{} is damaged: the {} layer is the wrong size'.format(path, name))
+        for offset, stored, raw, compressed in chunks:
+            if offset < 0 or data_start + offset + stored > size or (not compressed and stored != raw):
+                raise SaveFormatError('{} is damaged: the {} layer is cut short'.format(path, name))
+
+
+def save_path(name):
+    """
+    Get the path of a saved game in SAVE_DIR.
+
+    Args:
+        name (str): The save's name, without the extension.
+
+    Returns:
+        str: The path.
+    """
+    return os.path.join(SAVE_DIR, name + SAVE_EXTENSION)
+
+
+def latest_save():
+    """
+    Find the most recently written saved game in SAVE_DIR.
+
+    Returns:
+        str: Its path, or None if there are no saves.
+    """
+    if not os.path.isdir(SAVE_DIR):
+        return None
+    paths = [os.path.join(SAVE_DIR, name) for name in os.listdir(SAVE_DIR) if name.endswith(SAVE_EXTENSION)]
+    return max(paths, key=os.path.getmtime, default=None)
+
+
+def _layers(globe):
+    # Per-vertex terrain, and the face colors of every level built so far
+    layers = {name: globe.terrain.arrays[name] for name in terrain.Terrain.ARRAY_NAMES}
+    for level, colors in globe._level_colors.items():
+        layers['face_colors_l{}'.format(level)] = colors
+    return layers
+
+
+def _chunks(array):
+    # Yield (compressed flag, stored bytes, raw length) for each chunk of an array's bytes
+    data = memoryview(np.ascontiguousarray(array).reshape(-1).view(np.uint8))
+    for start in range(0, len(data), SAVE_CHUNK_BYTES):
+        raw = data[start:start + SAVE_CHUNK_BYTES]
+        packed = zlib.compress(raw, SAVE_COMPRESSION_LEVEL)
+        if len(packed) < len(raw):
+            yield True, packed, len(raw)
+        else:
+            yield False, raw, len(raw)
+
+
+def save(path, globe):
+    """
+    Save a globe, in the view it is shown in.
+
+    Args:
+        path (str): Where to write the save.
+        globe (Icosphere): The globe to save.
+    """
+    view = {
+        'cum_theta_y': globe.cum_theta_y,
+        'cum_theta_x': globe.cum_theta_x,
+        'scale': globe.scale,
+        'render_mode': globe.render_mode,
+        'render_backend': globe.render_backend,
+        'show_tiles': globe.show_tiles,
+        'lod_enabled': globe.lod_enabled,
+        'selected': None if globe.selected is None else [int(index) for index in globe.selected],
+    }
+
+    # A globe loaded from a save reads its layers from that file, which may be the one about to be replaced. Every
+    # layer is in memory once gathered for writing, so the file can be closed then.
+    layers = _layers(globe)
+    for lazy in (globe.terrain.arrays, globe._level_colors):
+        if isinstance(lazy, LazyLayers):
+            lazy.close()
+    write(path, globe.mapsize, globe.compact, globe.terrain.seed, globe.vertices_count, layers,
+          requested_mapsize=globe.requested_mapsize, view=view)
+
+
+def write(path, mapsize, compact, seed, vertices, layers, requested_mapsize=None, view=None):
+    """
+    Write a save. The file is written next to its destination and then moved into place, so an interrupted save
+    never leaves a broken file behind.
+
+    Args:
+        path (str): Where to write the save.
+        mapsize (str): The preset the globe's mesh was built for.
+        compact (bool): Whether the mesh uses compact storage.
+        seed (int): The terrain's seed.
+        vertices (int): Number of vertices of the mesh, to check it against on load.
+        layers (dict): Per-vertex and per-face arrays by name: the terrain arrays, and any 'face_colors_l<level>'.
+        requested_mapsize (str): The preset that was asked for, if the memory budget downgraded it to mapsize.
+        view (dict): The view to restore on load, as written by save. Leave out to open in the default view.
+    """
+    header = {
+        'mapsize': mapsize,
+        'requested_mapsize': requested_mapsize or mapsize,
+        'compact': bool(compact),
+        'seed': int(seed),
+        'subdivision_version': geometry.SUBDIVISION_VERSION,
+        'vertices': int(vertices),
+        'view': view,
+        'layers': {},
+    }
+
+    # Compress the layers first, since the header that precedes them lists where every chunk ends up
+    chunks = []
+    offset = 0
+    for name, array in layers.items():
+        layer = header['layers'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'chunks': []}
+        for compressed, data, raw in _chunks(array):
+            layer['chunks'].append([offset, len(data), raw, compressed])
+            chunks.append(data)
+            offset += len(data)
+
+    encoded = json.dumps(header).encode('utf-8')
+    data_start = -(-(_PREAMBLE.size + len(encoded)) // _ALIGNMENT) * _ALIGNMENT
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            file.write(encoded)
+            file.write(b'\0' * (data_start - _PREAMBLE.size - len(encoded)))
+            for data in chunks:
+                file.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _open(path):
+    """
+    Memory map a save and read its header.
+
+    Returns:
+        tuple: (header, buffer, data_start).
+
+    Raises:
+        SaveFormatError: If the file is not a save, one from another format version, or a damaged one.
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buffer) < _PREAMBLE.size:
+        raise SaveFormatError('{} is not a saved game'.format(path))
+
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise SaveFormatError('{} is not a saved game'.format(path))
+    if version != FORMAT_VERSION:
+        raise SaveFormatError('{} is save format version {}, expected {}'.format(path, version, FORMAT_VERSION))
+
+    try:
+        header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length].decode('utf-8'))
+        data_start = -(-(_PREAMBLE.size + header_length) // _ALIGNMENT) * _ALIGNMENT
+        _check_layers(path, header, len(buffer), data_start)
+    except SaveFormatError:
+        buffer.close()
+        raise
+    except (ValueError, KeyError, TypeError) as e:
+        buffer.close()
+        raise SaveFormatError('{} has a damaged header'.format(path)) from e
+    return header, buffer, data_start
+
+
+def read_header(path):
+    """
+    Read the header of a save without loading any of its layers.
+
+    Args:
+        path (str): The save.
+
+    Returns:
+        dict: The header, with the preset under 'mapsize' and the view settings under 'view'.
+    """
+    header, buffer, _ = _open(path)
+    buffer.close()
+    return header
+
+
+def load(path, progress_callback=None, cancel_event=None):
+    """
+    Load a saved globe.
+
+    The mesh comes from the mesh cache as for a new globe, and the layers stay in the memory mapped file until they
+    are first used.
+
+    Args:
+        path (str): The save.
+        progress_callback (callable): Called with the fraction done, as for Icosphere.
+        cancel_event (threading.Event): When set, loading stops by raising BuildCancelled.
+
+    Returns:
+        Icosphere: The saved globe, in the view it was saved in, or the default view if the save has none.
+
+    Raises:
+        SaveFormatError: If the file is not a save this version can read, or its preset no longer fits in the mesh
+            memory budget or builds the mesh it was saved with.
+        MeshBudgetExceeded: If no preset fits in the mesh memory budget.
+    """
+    # Imported here so that writing saves, as the batch generator does, works without pygame
+    from icosphere import Icosphere
+
+    header, buffer, data_start = _open(path)
+    try:
+        if header['subdivision_version'] != geometry.SUBDIVISION_VERSION:
+            raise SaveFormatError('{} was saved with a different subdivision version'.format(path))
+
+        # The layers only match the saved preset's mesh, so it is checked against the budget before anything is
+        # built rather than downgraded by Icosphere
+        if geometry.fit_memory_budget(header['mapsize'], header['compact']) != header['mapsize']:
+            raise SaveFormatError('{} needs the {} preset, which no longer fits in the mesh memory budget'.format(
+                path, header['mapsize']))
+
+        # Face colors are kept by level, like in the globe's own dict of them
+        prefix = 'face_colors_l'
+        terrain_layers = {name: layer for name, layer in header['layers'].items() if not name.startswith(prefix)}
+        color_layers = {int(name[len(prefix):]): layer for name, layer in header['layers'].items()
+                        if name.startswith(prefix)}
+
+        terrain_arrays = LazyLayers(buffer, data_start, terrain_layers)
+        globe = Icosphere(header['mapsize'], progress_callback=progress_callback, cancel_event=cancel_event,
+                          compact=header['compact'], loaded_terrain=terrain.Terrain(header['seed'], terrain_arrays))
+        if globe.mapsize != header['mapsize'] or globe.vertices_count != header['vertices']:
+            raise SaveFormatError('{} does not match the mesh of the {} preset'.format(path, header['mapsize']))
+        globe.requested_mapsize = header['requested_mapsize']
+
+        # Face colors of the levels that had been drawn, left in the file until a frame draws that level again
+        globe._level_colors = LazyLayers(buffer, data_start, color_layers)
+
+        view = header['view']
+        if view is not None:
+            globe.rotate_around_x_and_y(view['cum_theta_y'], view['cum_theta_x'])
+            globe.zoom_level = view['scale']
+            globe.render_mode = view['render_mode']
+            globe.render_backend = view['render_backend']
+            globe.show_tiles = view['show_tiles']
+            globe.lod_enabled = view['lod_enabled']
+            globe.selected = None if view['selected'] is None else tuple(view['selected'])
+            globe.need_redraw = True
+    except BaseException:
+        # Whatever went wrong, a cancelled build included, the globe and its layers are not kept
+        buffer.close()
+        raise
+    return globe
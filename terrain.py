@@ -0,0 +1,230 @@
+import numpy as np
+import mesh_cache
+from config import TERRAIN_SEA_LEVEL
+
+# Procedural terrain for the icosphere: elevation, land and sea, and biomes for every vertex.
+#
+# Everything is sampled from 3D gradient (Perlin) noise at the vertex positions, so there are no seams or pole
+# distortions, and the same seed always gives the same planet. Noise is evaluated over whole arrays of vertices,
+# a chunk at a time to keep the temporary arrays small on the largest presets.
+
+# Bump when the generator changes, so cached terrain from an older version is not reused
+TERRAIN_VERSION = 1
+
+# Biomes, indexed by the values of the biome array
+BIOME_NAMES = ('Deep Ocean', 'Ocean', 'Beach', 'Desert', 'Grassland', 'Forest', 'Tundra', 'Snow', 'Mountain')
+DEEP_OCEAN, OCEAN, BEACH, DESERT, GRASSLAND, FOREST, TUNDRA, SNOW, MOUNTAIN = range(len(BIOME_NAMES))
+
+# Map color of every biome, as RGB
+BIOME_COLORS = np.array([(20, 40, 110), (40, 80, 160), (220, 210, 150), (210, 180, 100), (110, 170, 70),
+                         (40, 110, 50), (140, 150, 120), (240, 240, 245), (120, 110, 100)], dtype=np.uint8)
+
+# Vertices evaluated at once, small enough for the temporary arrays to stay in the CPU cache
+_CHUNK_SIZE = 1 << 16
+
+# The 12 gradient directions of improved Perlin noise, the midpoints of a cube's edges, tiled over the 256 hash
+# values and split by axis so each is a single lookup
+_GRADIENTS = np.array([[1, 1, 0], [-1, 1, 0], [1, -1, 0], [-1, -1, 0],
+                       [1, 0, 1], [-1, 0, 1], [1, 0, -1], [-1, 0, -1],
+                       [0, 1, 1], [0, -1, 1], [0, 1, -1], [0, -1, -1]], dtype=np.float32)[np.arange(256) % 12]
+_GRADIENT_X, _GRADIENT_Y, _GRADIENT_Z = (np.ascontiguousarray(_GRADIENTS[:, axis]) for axis in range(3))
+
+
+class Terrain:
+    """
+    Per-vertex terrain fields of a globe:
+
+        elevation: (V,) float32, from -1 (deepest) to 1 (highest), with the sea at TERRAIN_SEA_LEVEL.
+        land: (V,) bool, True above the sea.
+        biome: (V,) uint8 index into BIOME_NAMES.
+    """
+
+    ARRAY_NAMES = ('elevation', 'land', 'biome')
+
+    def __init__(self, seed, arrays):
+        """
+        Args:
+            seed (int): The seed the terrain was generated from.
+            arrays (Mapping): The fields by name. Each is only looked up when first used, so a mapping that
+                loads on access (such as a saved game's layers) keeps unused fields on disk.
+        """
+        self.seed = seed
+        self.arrays = arrays
+
+    @property
+    def elevation(self):
+        return self.arrays['elevation']
+
+    @property
+    def land(self):
+        return self.arrays['land']
+
+    @property
+    def biome(self):
+        return self.arrays['biome']
+
+    @property
+    def land_fraction(self):
+        """The fraction of vertices above the sea."""
+        return float(np.count_nonzero(self.land)) / len(self.land)
+
+    @property
+    def nbytes(self):
+        # Mappings that load on access, like a saved game's layers, can tell the size of a field without loading it
+        layer_nbytes = getattr(self.arrays, 'layer_nbytes', None)
+        if layer_nbytes is not None:
+            return sum(layer_nbytes(name) for name in self.ARRAY_NAMES)
+        return sum(self.arrays[name].nbytes for name in self.ARRAY_NAMES)
+
+
+def _permutation(rng):
+    # Shuffled 0-255, repeated so that hashing a corner never has to wrap around
+    permutation = rng.permutation(256)
+    return np.concatenate([permutation, permutation]).astype(np.int32)
+
+
+def _gradient_noise(points, permutation):
+    """
+    Evaluate 3D gradient noise.
+
+    Args:
+        points (numpy.ndarray): (3, N) float32 array of sample positions, one row per axis so every coordinate is
+            contiguous.
+        permutation (numpy.ndarray): (512,) hash table from _permutation.
+
+    Returns:
+        numpy.ndarray: (N,) float32 noise values, roughly between -1 and 1.
+    """
+    floors = np.floor(points)
+    local = points - floors
+    cells = floors.astype(np.int32) & 255
+
+    # Quintic fade curve of the position within the cell, for smooth derivatives across cell borders
+    fade = local * local * local * (local * (local * 6 - 15) + 10)
+
+    # Offsets from the lower and upper corner along each axis
+    offsets = [(local[axis], local[axis] - 1) for axis in range(3)]
+
+    # Hash the 8 cube corners, sharing the lookups of the x and then the y coordinate between corners
+    hashed_x = [np.take(permutation, cells[0] + dx) for dx in (0, 1)]
+    hashed_xy = [np.take(permutation, hashed_x[dx] + cells[1] + dy) for dx in (0, 1) for dy in (0, 1)]
+
+    # Dot product of every corner's gradient with the offset from that corner, in x, y, z corner order
+    dots = []
+    for corner in range(8):
+        dx, dy, dz = corner >> 2, (corner >> 1) & 1, corner & 1
+        hashed = np.take(permutation, hashed_xy[corner >> 1] + cells[2] + dz)
+        dots.append(np.take(_GRADIENT_X, hashed) * offsets[0][dx] + np.take(_GRADIENT_Y, hashed) * offsets[1][dy] +
+                    np.take(_GRADIENT_Z, hashed) * offsets[2][dz])
+
+    # Trilinear interpolation, z first, then y, then x
+    along_z = [dots[i] + fade[2] * (dots[i + 1] - dots[i]) for i in range(0, 8, 2)]
+    along_y = [along_z[i] + fade[1] * (along_z[i + 1] - along_z[i]) for i in range(0, 4, 2)]
+    return along_y[0] + fade[0] * (along_y[1] - along_y[0])
+
+
+def _fractal_noise(points, permutation, frequency, octaves, offset):
+    # Sum octaves of noise at doubling frequency and halving amplitude, normalized back to roughly -1 to 1
+    total = np.zeros(points.shape[1], dtype=np.float32)
+    amplitude = 1.0
+    for _ in range(octaves):
+        total += np.float32(amplitude) * _gradient_noise(points * np.float32(frequency) + offset[:, np.newaxis],
+                                                         permutation)
+        frequency *= 2.0
+        amplitude *= 0.5
+    return total / (2.0 - 2.0 ** (1 - octaves))
+
+
+def _classify(elevation, latitude, moisture):
+    """
+    Pick a biome for every vertex.
+
+    Args:
+        elevation (numpy.ndarray): Elevation, as in Terrain.
+        latitude (numpy.ndarray): Absolute latitude, from 0 at the equator to 1 at the poles.
+        moisture (numpy.ndarray): Moisture, roughly from -1 to 1.
+
+    Returns:
+        numpy.ndarray: (N,) uint8 biome indices.
+    """
+    height = (elevation - TERRAIN_SEA_LEVEL) / (1.0 - TERRAIN_SEA_LEVEL)
+
+    # Colder towards the poles and higher up
+    temperature = 1.0 - latitude - 0.6 * np.maximum(height, 0.0)
+
+    conditions = [
+        elevation < TERRAIN_SEA_LEVEL - 0.25,
+        elevation < TERRAIN_SEA_LEVEL,
+        height > 0.45,
+        temperature < 0.12,
+        temperature < 0.3,
+        height < 0.03,
+        moisture < -0.1,
+        moisture < 0.15,
+    ]
+    choices = [DEEP_OCEAN, OCEAN, MOUNTAIN, SNOW, TUNDRA, BEACH, DESERT, GRASSLAND]
+    return np.select(conditions, choices, default=FOREST).astype(np.uint8)
+
+
+def generate(vertices, seed, progress_callback=None):
+    """
+    Generate the terrain of every vertex.
+
+    Args:
+        vertices (numpy.ndarray): (V, 3) array of unit length vertex positions. The y axis runs through the poles.
+        seed (int): Seed for the noise, so the same seed gives the same terrain.
+        progress_callback (callable): Called with the fraction of vertices done after each chunk.
+
+    Returns:
+        Terrain: The generated terrain.
+    """
+    rng = np.random.default_rng(seed)
+    elevation_permutation = _permutation(rng)
+    moisture_permutation = _permutation(rng)
+
+    # Random offsets into the noise, so different seeds also sample different regions of it
+    elevation_offset = rng.uniform(0, 256, 3).astype(np.float32)
+    moisture_offset = rng.uniform(0, 256, 3).astype(np.float32)
+
+    elevation = np.empty(len(vertices), dtype=np.float32)
+    biome = np.empty(len(vertices), dtype=np.uint8)
+    for start in range(0, len(vertices), _CHUNK_SIZE):
+        points = np.ascontiguousarray(np.asarray(vertices[start:start + _CHUNK_SIZE], dtype=np.float32).T)
+
+        # Large continents with finer detail on top, then pushed away from the sea level so coasts are steeper
+        heights = _fractal_noise(points, elevation_permutation, 1.5, 5, elevation_offset)
+        heights = np.clip(np.sign(heights) * np.abs(heights) ** 0.8 * 1.4, -1.0, 1.0)
+
+        moisture = _fractal_noise(points, moisture_permutation, 2.0, 3, moisture_offset)
+        latitude = np.abs(points[1])
+
+        stop = start + points.shape[1]
+        elevation[start:stop] = heights
+        biome[start:stop] = _classify(heights, latitude, moisture)
+        if progress_callback is not None:
+            progress_callback(stop / len(vertices))
+
+    return Terrain(seed, {'elevation': elevation, 'land': elevation >= TERRAIN_SEA_LEVEL, 'biome': biome})
+
+
+def load_or_generate(mesh_key, vertices, seed, progress_callback=None):
+    """
+    Load the terrain of a mesh and seed from the on-disk cache, generating and caching it on the first use.
+
+    Args:
+        mesh_key (str): Cache key of the mesh the terrain belongs to.
+        vertices (numpy.ndarray): The mesh's vertices.
+        seed (int): Seed for the noise.
+        progress_callback (callable): Called with the fraction done while generating.
+
+    Returns:
+        Terrain: The terrain.
+    """
+    key = '{}-terrain-s{}-sea{:g}-v{}'.format(mesh_key, seed, TERRAIN_SEA_LEVEL, TERRAIN_VERSION)
+    arrays = mesh_cache.load_arrays(key, Terrain.ARRAY_NAMES)
+    if arrays is not None:
+        return Terrain(seed, arrays)
+
+    terrain = generate(vertices, seed, progress_callback)
+    mesh_cache.save_arrays(key, terrain.arrays)
+    return terrain
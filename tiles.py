@@ -0,0 +1,152 @@
+import numpy as np
+import pygame
+import rasterizer
+import geometry
+import adjacency
+
+# Tile layer of the icosphere: its dual, the Goldberg polyhedron.
+#
+# Every vertex of the icosphere becomes a tile centered on it, and the centroids of the faces around the vertex
+# become the tile's corners. Vertices with 6 faces give hexagons, and the 12 vertices of the base icosahedron give
+# the only pentagons. Two tiles are neighbours when their vertices share an edge, and the border between them runs
+# from the centroid of one face on that edge, through the edge's midpoint, to the centroid of the other.
+#
+# The tiles reuse the icosphere's adjacency tables (see adjacency): vertex_face_adjacency lists each tile's corners
+# counter-clockwise, and vertex_adjacency lists its neighbours.
+
+
+class TileLayer:
+    def __init__(self, globe):
+        """
+        Create the tile layer of a globe.
+
+        Args:
+            globe (Icosphere): The globe whose vertices become tiles.
+        """
+        self.globe = globe
+
+    def __len__(self):
+        return self.globe.vertices_count
+
+    @property
+    def centers(self):
+        """(T, 3) array of the tile centers, which are the globe's vertices."""
+        return self.globe.vertices
+
+    @property
+    def corners(self):
+        """Adjacency from every tile to the faces whose centroids are its corners, counter-clockwise."""
+        return self.globe.vertex_face_adjacency
+
+    @property
+    def neighbors(self):
+        """Adjacency from every tile to its neighbouring tiles, counter-clockwise."""
+        return self.globe.vertex_adjacency
+
+    def sides(self, tile=None):
+        """
+        Get the number of sides of one tile, or of every tile.
+
+        Args:
+            tile (int): The tile. Leave out to get the sides of every tile.
+
+        Returns:
+            int or numpy.ndarray: 5 for pentagons and 6 for hexagons.
+        """
+        return self.corners.degree(tile)
+
+    def corner_positions(self, face_ids):
+        """
+        Get the positions of tile corners: the face centroids, pushed out onto the unit sphere.
+
+        Args:
+            face_ids (numpy.ndarray): Indices of the faces in the globe's finest level.
+
+        Returns:
+            numpy.ndarray: (N, 3) array of corner positions.
+        """
+        faces = self.globe.faces[np.asarray(face_ids)]
+        return self._centroids(self.globe.vertices, faces)
+
+    def polygons(self, tiles):
+        """
+        Get the corner positions of several tiles at once.
+
+        Args:
+            tiles (numpy.ndarray): Indices of the tiles.
+
+        Returns:
+            tuple: (polygons, sides) where polygons is an (N, adjacency.MAX_DEGREE, 3) array of corners,
+            counter-clockwise as seen from outside, with a pentagon's last corner repeated to fill the row, and sides
+            is the number of distinct corners of each tile.
+        """
+        tiles = np.asarray(tiles, dtype=np.int64)
+        indptr = self.corners.indptr
+        starts = indptr[tiles].astype(np.int64)
+        sides = indptr[tiles + 1].astype(np.int64) - starts
+
+        # Position of every corner in the adjacency's indices, clamped to the tile's last corner
+        offsets = np.minimum(np.arange(adjacency.MAX_DEGREE), sides[:, np.newaxis] - 1)
+        face_ids = self.corners.indices[starts[:, np.newaxis] + offsets]
+        return self.corner_positions(face_ids.ravel()).reshape(len(tiles), adjacency.MAX_DEGREE, 3), sides
+
+    def polygon(self, tile):
+        """
+        Get the corner positions of one tile.
+
+        Args:
+            tile (int): The tile.
+
+        Returns:
+            numpy.ndarray: (5, 3) or (6, 3) array of corners, counter-clockwise as seen from outside.
+        """
+        return self.corner_positions(self.corners.neighbors(tile))
+
+    @staticmethod
+    def _centroids(vertices, faces):
+        centroids = (vertices[faces[..., 0]].astype(np.float64) + vertices[faces[..., 1]] +
+                     vertices[faces[..., 2]])
+        return centroids / np.linalg.norm(centroids, axis=-1)[..., np.newaxis]
+
+    def draw(self, screen, color=(255, 255, 255)):
+        """
+        Draw the tile borders of the faces the globe would draw this frame.
+
+        The borders come from the globe's culled and level of detail selected faces. A coarser level is drawn as
+        the tiles of that level, so zoomed out views stay as cheap as the triangle wireframe. Each shared edge of
+        the visible faces gives one border, drawn as a single polyline.
+
+        Args:
+            screen (pygame.Surface): The surface to draw on.
+            color (tuple): The border color.
+        """
+        globe = self.globe
+        faces = globe._frame_buffers()['visible_faces']
+        if len(faces) == 0:
+            return
+
+        # The faces on either side of every edge. Edges on the edge of the visible set, or between faces of
+        # different levels, only have one, and their border stops at the edge midpoint.
+        edges, face_edges = geometry.edge_table(faces)
+        order = np.argsort(face_edges.ravel(), kind='stable')
+        counts = np.bincount(face_edges.ravel(), minlength=len(edges))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        first = order[starts] // 3
+        second = np.where(counts > 1, order[np.minimum(starts + 1, len(order) - 1)] // 3, first)
+
+        # Project the face centroids and the edge midpoints, both pushed out onto the sphere
+        vertices = globe.vertices
+        midpoints = vertices[edges[:, 0]].astype(np.float64) + vertices[edges[:, 1]]
+        midpoints /= np.linalg.norm(midpoints, axis=1)[:, np.newaxis]
+        points = np.concatenate([self._centroids(vertices, faces), midpoints])
+        projected = globe.project_vertices(np.dot(points, globe.orientation))
+        centroids_2d, midpoints_2d = projected[:len(faces)], projected[len(faces):]
+
+        borders = np.stack([centroids_2d[first], midpoints_2d, centroids_2d[second]], axis=1)
+        single = counts == 1
+        borders[single, 2] = midpoints_2d[single]
+        if globe.uses_rasterizer(screen):
+            rasterizer.draw_lines(screen, borders[:, :2].reshape(-1, 2), borders[:, 1:].reshape(-1, 2), color)
+            return
+        for border in borders.tolist():
+            pygame.draw.lines(screen, color, False, border)
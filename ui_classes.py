@@ -1,5 +1,6 @@
 import pygame
-from icosphere import Icosphere
+from fonts import render_text, FONT_REGULAR, FONT_BOLD, FONT_LIGHT
+from profiler import frame_profiler
 
 
 class Button:
@@ -11,9 +12,8 @@ class Button:
 
     def draw(self, screen):
         pygame.draw.rect(screen, (128, 128, 128), self.rect)
-        font = pygame.font.Font('assets/fonts/Urbanist-Bold.ttf', 20)
 
-        label = font.render(self.text, 1, (255, 255, 255))
+        label = render_text(FONT_BOLD, 20, self.text, (255, 255, 255))
         label_width, label_height = label.get_size()
         center_x = (self.rect.width - label_width) // 2
         center_y = (self.rect.height - label_height) // 2
@@ -42,15 +42,14 @@ class DebugMenu:
         self.scroll_area = ScrollableArea(self.rect.x + 5, self.rect.y + 5, self.rect.width - 10,
                                           self.rect.height - 30)
 
+        # Create a semi-transparent surface for the background
+        self.background = pygame.Surface((self.rect.width, self.rect.height))
+        self.background.set_alpha(224)  # Semi-transparent
+        self.background.fill((220, 220, 220))  # Fill with the color
+
     def draw(self, screen, globe):
         if self.is_visible:
-            # Create a semi-transparent surface for the background
-            semi_transparent_surface = pygame.Surface((self.rect.width, self.rect.height))
-            semi_transparent_surface.set_alpha(224)  # Semi-transparent
-            semi_transparent_surface.fill((220, 220, 220))  # Fill with the color
-            screen.blit(semi_transparent_surface, (self.rect.x, self.rect.y))
-
-            menu_font = pygame.font.Font('assets/fonts/Urbanist-Regular.ttf', 14)
+            screen.blit(self.background, (self.rect.x, self.rect.y))
 
             # Draw the tabs
             for i, tab in enumerate(self.tabs):
@@ -58,13 +57,25 @@ class DebugMenu:
                 tab_y = self.rect.y - self.TAB_HEIGHT
                 pygame.draw.rect(screen, (220, 220, 220), (tab_x, tab_y, self.TAB_WIDTH, self.TAB_HEIGHT),
                                  border_top_left_radius=10, border_top_right_radius=10)
-                tab_surface = menu_font.render(tab, True, (0, 0, 0))
+                tab_surface = render_text(FONT_REGULAR, 14, tab, (0, 0, 0))
                 surface_width, surface_height = tab_surface.get_size()
                 center_x = tab_x + (self.TAB_WIDTH - surface_width) // 2
                 center_y = tab_y + (self.TAB_HEIGHT - surface_height) // 2
 
                 screen.blit(tab_surface, (center_x, center_y))
 
+            if self.active_tab == "Console":
+                if frame_profiler.enabled:
+                    self.scroll_area.content = frame_profiler.report_lines() + [
+                        "P: stop profiling, O: write trace file"
+                    ]
+                else:
+                    self.scroll_area.content = [
+                        "Profiling is off.",
+                        "P: start profiling, O: write trace file"
+                    ]
+                self.scroll_area.draw(screen)
+
             if self.active_tab == "Planet Info":
                 if globe is None:
                     self.scroll_area.content = [
@@ -72,13 +83,22 @@ class DebugMenu:
                     ]
                     self.scroll_area.draw(screen)
                 else:
+                    map_size = globe.mapsize
+                    if globe.requested_mapsize != globe.mapsize:
+                        map_size += " ({} is over the memory budget)".format(globe.requested_mapsize)
+
                     self.scroll_area.content = [
-                        "Map Size: {}".format(globe.mapsize),
+                        "Map Size: {}".format(map_size),
+                        "Mesh Memory: {:.1f} MB{}".format(globe.memory_footprint / 1024 / 1024,
+                                                          " (compact)" if globe.compact else ""),
+                        "Seed: {}".format(globe.terrain.seed),
+                        "Land: {:.0%}".format(globe.terrain.land_fraction),
                         "Total Vertices: {}".format(globe.vertices_count),
                         "Total Faces: {}".format(globe.faces_count),
                         "Vertices on Screen: {}".format(globe.drawn_vertices_count),
                         "Faces on Screen: {}".format(globe.drawn_faces_count),
-                        "Zoom: {:.2f}".format(globe.normalized_scale)
+                        "Zoom: {:.2f}".format(globe.normalized_scale),
+                        "Render Mode: {} ({})".format(globe.render_mode, globe.render_backend)
                     ]
                     self.scroll_area.draw(screen)
 
@@ -88,7 +108,7 @@ class DebugMenu:
 
     def handle_debug_menu_event(self, event):
         if self.is_visible:
-            if self.active_tab == "Planet Info":
+            if self.active_tab in ("Console", "Planet Info"):
                 self.scroll_area.handle_scrollable_event(event)
 
         if event.type == pygame.MOUSEBUTTONDOWN:
@@ -103,7 +123,7 @@ class DebugMenu:
 
 class GameMenu:
     MENU_WIDTH = 130
-    MENU_HEIGHT = 210
+    MENU_HEIGHT = 260
 
     def __init__(self, screen_width, screen_height, game_manager):
         # Calculate x, y for centered position
@@ -114,19 +134,21 @@ class GameMenu:
         self.rect = pygame.Rect(x, y, self.MENU_WIDTH, self.MENU_HEIGHT)
         self.game_buttons = [
             Button(self.rect.x + 10, self.rect.y + 10, 110, 40, 'New Game', self),
-            Button(self.rect.x + 10, self.rect.y + 60, 110, 40, 'Load Game', self),
-            Button(self.rect.x + 10, self.rect.y + 110, 110, 40, 'Options', self),
-            Button(self.rect.x + 10, self.rect.y + 160, 110, 40, 'Quit', self)
+            Button(self.rect.x + 10, self.rect.y + 60, 110, 40, 'Save Game', self),
+            Button(self.rect.x + 10, self.rect.y + 110, 110, 40, 'Load Game', self),
+            Button(self.rect.x + 10, self.rect.y + 160, 110, 40, 'Options', self),
+            Button(self.rect.x + 10, self.rect.y + 210, 110, 40, 'Quit', self)
         ]
         self.is_visible = False
         self.quit_dialog = QuitDialog(screen_width, screen_height, self)
 
+        self.background = pygame.Surface((self.MENU_WIDTH, self.MENU_HEIGHT))
+        self.background.set_alpha(224)  # Semi-transparent
+        self.background.fill((220, 220, 220))
+
     def draw(self, screen):
         if self.is_visible:
-            semi_transparent_surface = pygame.Surface((self.MENU_WIDTH, self.MENU_HEIGHT))
-            semi_transparent_surface.set_alpha(224)  # Semi-transparent
-            semi_transparent_surface.fill((220, 220, 220))
-            screen.blit(semi_transparent_surface, (self.rect.x, self.rect.y))
+            screen.blit(self.background, (self.rect.x, self.rect.y))
 
             for game_button in self.game_buttons:
                 game_button.draw(screen)
@@ -145,12 +167,43 @@ class GameMenu:
                     if game_button.rect.collidepoint(event.pos):
                         game_button.handle_button_event(event)
                         if game_button.text == 'New Game':
-                            new_globe = Icosphere("Tiny")
-                            self.game_manager.set_globe(new_globe)
+                            self.game_manager.start_new_game("Tiny")  # Generated in the background
+                        if game_button.text == 'Save Game':
+                            self.game_manager.save_game()
+                        if game_button.text == 'Load Game':
+                            self.game_manager.load_game()  # Loaded in the background
                         if game_button.text == 'Quit':
                             self.quit_dialog.toggle_visibility()  # Show the quit dialog
 
 
+class ProgressBar:
+    BAR_WIDTH = 300
+    BAR_HEIGHT = 24
+
+    def __init__(self, screen_width, screen_height):
+        # Centered near the bottom of the screen
+        x = (screen_width - self.BAR_WIDTH) // 2
+        y = screen_height - self.BAR_HEIGHT - 30
+
+        self.rect = pygame.Rect(x, y, self.BAR_WIDTH, self.BAR_HEIGHT)
+
+        self.background = pygame.Surface((self.BAR_WIDTH, self.BAR_HEIGHT))
+        self.background.set_alpha(224)  # Semi-transparent
+        self.background.fill((220, 220, 220))
+
+    def draw(self, screen, text, progress):
+        screen.blit(self.background, (self.rect.x, self.rect.y))
+
+        # Fill the bar up to the current progress
+        filled_width = int(self.BAR_WIDTH * max(0.0, min(progress, 1.0)))
+        pygame.draw.rect(screen, (128, 128, 128), (self.rect.x, self.rect.y, filled_width, self.BAR_HEIGHT))
+
+        label = render_text(FONT_REGULAR, 14, "{} {:.0%}".format(text, progress), (0, 0, 0))
+        label_width, label_height = label.get_size()
+        screen.blit(label, (self.rect.x + (self.BAR_WIDTH - label_width) // 2,
+                            self.rect.y + (self.BAR_HEIGHT - label_height) // 2))
+
+
 class QuitDialog:
     DIALOG_WIDTH = 290
     DIALOG_HEIGHT = 130
@@ -169,17 +222,17 @@ class QuitDialog:
                                  self, action=pygame.quit)
         self.no_button = Button(self.rect.x + 150, self.rect.y + 90, 130, 30, 'No, don’t quit', self)
 
+        # Create a semi-transparent surface for the background
+        self.background = pygame.Surface((self.DIALOG_WIDTH, self.DIALOG_HEIGHT))
+        self.background.set_alpha(224)  # Semi-transparent
+        self.background.fill((220, 220, 220))
+
     def draw(self, screen):
         if self.is_visible:
-            # Create a semi-transparent surface for the background
-            semi_transparent_surface = pygame.Surface((self.DIALOG_WIDTH, self.DIALOG_HEIGHT))
-            semi_transparent_surface.set_alpha(224)  # Semi-transparent
-            semi_transparent_surface.fill((220, 220, 220))
-            screen.blit(semi_transparent_surface, (self.rect.x, self.rect.y))
+            screen.blit(self.background, (self.rect.x, self.rect.y))
 
             # Draw the dialog question
-            font = pygame.font.Font('assets/fonts/Urbanist-Regular.ttf', 16)
-            label = font.render("Quit the game?", True, (0, 0, 0))
+            label = render_text(FONT_REGULAR, 16, "Quit the game?", (0, 0, 0))
             label_width, label_height = label.get_size()
             screen.blit(label, (self.rect.x + (self.DIALOG_WIDTH - label_width) // 2, self.rect.y + 30))
 
@@ -205,7 +258,6 @@ class ScrollableArea:
         self.rect = pygame.Rect(x, y, width, height)
         self.content = []
         self.offset_y = 0
-        self.font = pygame.font.Font('assets/fonts/Urbanist-Light.ttf', 13)
         self.scroll_speed = 10
         self.scrollbar_width = 10
         self.scrollbar_color = (50, 50, 50)
@@ -225,7 +277,7 @@ class ScrollableArea:
         visible_area = screen.subsurface(self.rect)
         y = self.offset_y
         for line in self.content:
-            text_surface = self.font.render(line, True, (0, 0, 0))
+            text_surface = render_text(FONT_LIGHT, 13, line, (0, 0, 0))
             visible_area.blit(text_surface, (5, y))
             y += 15
 